@@ -0,0 +1,365 @@
+# coding: utf-8
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+
+from PyQt5.QtCore import Qt, QObject, QByteArray, QCoreApplication, QEventLoop, QTimer, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtSvg import QSvgRenderer
+from PyQt5.QtWebChannel import QWebChannel
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+
+from ..common import mathjax
+from ..common.imaging import pixmap_to_bytes
+from ..common.render_cache import renderCache
+
+
+def svg_to_png(svg, scale=2.0):
+    """将独立的 SVG（宽高为像素）栅格化为透明背景的 PNG"""
+    renderer = QSvgRenderer(QByteArray(svg))
+    size = renderer.defaultSize()
+    image = QImage(max(1, math.ceil(size.width() * scale)), max(1, math.ceil(size.height() * scale)),
+                   QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    renderer.render(painter)
+    painter.end()
+    return pixmap_to_bytes(image)
+
+
+class BatchBridge(QObject):
+    """ 批量渲染页面的 QWebChannel 桥接对象 """
+
+    ready = pyqtSignal()
+    batch = pyqtSignal(dict)
+
+    @pyqtSlot()
+    def pageReady(self):
+        self.ready.emit()
+
+    @pyqtSlot(str)
+    def batchFinished(self, payload):
+        try:
+            self.batch.emit(json.loads(payload))
+        except ValueError as e:
+            print(f"解析批量渲染结果失败: {e}")
+
+
+class BatchRenderEngine(QObject):
+    """ 无界面的批量公式渲染引擎
+
+    所有公式共用一个不显示的 QWebEnginePage，MathJax 只加载一次；
+    排队的公式按批提交，每批只调用一次 JavaScript，结果逐条通过 rendered 信号和回调返回。
+    """
+
+    rendered = pyqtSignal(dict)  # {'index', 'latex', 'ok', 'error', 'svg', 'png', 'width', 'height', 'cached'}
+    finished = pyqtSignal()      # 队列中的公式全部完成
+
+    # 批量导出的参数，作为渲染缓存键的一部分
+    RENDER_OPTIONS = {'display': True, 'scale': 1.2, 'standalone': True}
+
+    def __init__(self, parent=None, batch_size=32, formats=('svg', 'png'), scale=2.0,
+                 callback=None, use_cache=True, ready_timeout=30000):
+        """
+        Args:
+            batch_size: 每次提交给页面的公式数
+            formats: 需要的输出格式，'svg' 和/或 'png'
+            scale: PNG 相对于 SVG 像素尺寸的缩放比例
+            callback: 每个公式完成时的回调，参数同 rendered 信号
+            use_cache: 是否使用渲染缓存
+            ready_timeout: 页面加载完成后等待 MathJax 就绪的最长时间（毫秒），
+                           超时（例如离线且本地没有 MathJax）时所有公式按失败返回
+        """
+        super().__init__(parent)
+        self.batch_size = max(1, int(batch_size))
+        self.formats = tuple(formats)
+        self.scale = scale
+        self.callback = callback
+        self.use_cache = use_cache
+
+        self.completed = 0
+        self.elapsed = 0.0
+        self._queue = deque()  # (序号, LaTeX)
+        self._next_index = 0
+        self._batch_id = 0
+        self._inflight = None  # 正在排版的批次: (批次ID, {序号: LaTeX}, 开始时间)
+        self._ready = False
+        self._error = None  # 页面不可用的原因，之后提交的公式直接失败
+
+        self.readyTimer = QTimer(self)
+        self.readyTimer.setSingleShot(True)
+        self.readyTimer.setInterval(ready_timeout)
+        self.readyTimer.timeout.connect(lambda: self.abort('MathJax 加载超时，请检查网络或先下载到本地'))
+
+        self.bridge = BatchBridge(self)
+        self.bridge.ready.connect(self._onReady)
+        self.bridge.batch.connect(self._onBatch)
+
+        self.page = QWebEnginePage(self)
+        self.channel = QWebChannel(self.page)
+        self.channel.registerObject('bridge', self.bridge)
+        self.page.setWebChannel(self.channel)
+        self.page.loadFinished.connect(self._onLoadFinished)
+        self.page.setHtml(mathjax.page_html(), mathjax.base_url())
+
+    def isReady(self):
+        return self._ready
+
+    def isIdle(self):
+        return not self._queue and self._inflight is None
+
+    def submit(self, latexes):
+        """
+        将公式加入队列
+        Returns:
+            list: 每个公式的序号，结果中的 index 与之对应
+        """
+        indexes = []
+        for latex in latexes:
+            index = self._next_index
+            self._next_index += 1
+            indexes.append(index)
+
+            result = self._fromCache(index, latex)
+            if result is None and self._error is not None:
+                result = self._failure(index, latex, self._error)
+            if result is not None:
+                # 缓存命中的结果在下一次事件循环中返回，保证调用方先拿到序号
+                QTimer.singleShot(0, lambda r=result: self._emit(r))
+            else:
+                self._queue.append((index, latex))
+        self._pump()
+        return indexes
+
+    def _fromCache(self, index, latex):
+        if not self.use_cache:
+            return None
+        svg = renderCache.get(latex, 'svg', **self.RENDER_OPTIONS)
+        if svg is None:
+            return None
+        png = None
+        if 'png' in self.formats:
+            png = renderCache.get(latex, 'png', png_scale=self.scale, **self.RENDER_OPTIONS)
+            if png is None:
+                png = svg_to_png(svg, self.scale)
+                renderCache.put(latex, 'png', png, png_scale=self.scale, **self.RENDER_OPTIONS)
+        return {
+            'index': index, 'latex': latex, 'ok': True, 'error': None,
+            'svg': svg if 'svg' in self.formats else None, 'png': png,
+            'width': None, 'height': None, 'cached': True
+        }
+
+    def _failure(self, index, latex, error):
+        return {
+            'index': index, 'latex': latex, 'ok': False, 'error': error,
+            'svg': None, 'png': None, 'width': None, 'height': None, 'cached': False
+        }
+
+    def _onLoadFinished(self, ok):
+        if not ok:
+            self.abort('渲染页面加载失败')
+        elif not self._ready:
+            self.readyTimer.start()
+
+    def _onReady(self):
+        self.readyTimer.stop()
+        if self._error is not None:
+            return
+        self._ready = True
+        self._pump()
+
+    def abort(self, error):
+        """页面不可用或等待超时：排队和正在排版的公式全部按失败返回"""
+        self.readyTimer.stop()
+        self._error = error
+        self._ready = False
+        print(f"批量渲染中止: {error}")
+
+        items = []
+        if self._inflight is not None:
+            items.extend(self._inflight[1].items())
+            self._inflight = None
+        items.extend(self._queue)
+        self._queue.clear()
+        for index, latex in items:
+            self._emit(self._failure(index, latex, error))
+
+    def _pump(self):
+        """页面空闲时提交下一批"""
+        if not self._ready or self._inflight is not None or not self._queue:
+            return
+
+        items = {}
+        while self._queue and len(items) < self.batch_size:
+            index, latex = self._queue.popleft()
+            items[index] = latex
+        self._batch_id += 1
+        self._inflight = (self._batch_id, items, time.perf_counter())
+
+        payload = json.dumps([{'index': i, 'latex': l} for i, l in items.items()])
+        self.page.runJavaScript(f"renderBatch({payload}, {self._batch_id});")
+
+    def _onBatch(self, info):
+        if self._inflight is None or info.get('id') != self._inflight[0]:
+            return
+        _, items, start = self._inflight
+        self._inflight = None
+        if info.get('error'):
+            print(f"批量渲染失败: {info['error']}")
+
+        returned = set()
+        for item in info.get('results', []):
+            index = item['index']
+            latex = items.get(index)
+            if latex is None:
+                continue
+            returned.add(index)
+            self._emit(self._makeResult(index, latex, item))
+
+        # 页面异常时没有返回的公式按失败处理
+        for index, latex in items.items():
+            if index not in returned:
+                self._emit(self._failure(index, latex, info.get('error') or '没有返回结果'))
+
+        self.elapsed += time.perf_counter() - start
+        self._pump()
+
+    def _makeResult(self, index, latex, item):
+        svg = item.get('svg')
+        svg = svg.encode('utf-8') if svg else None
+        png = None
+        if svg and 'png' in self.formats:
+            png = svg_to_png(svg, self.scale)
+        if self.use_cache and svg and item.get('ok'):
+            renderCache.put(latex, 'svg', svg, **self.RENDER_OPTIONS)
+            if png:
+                renderCache.put(latex, 'png', png, png_scale=self.scale, **self.RENDER_OPTIONS)
+        return {
+            'index': index, 'latex': latex, 'ok': bool(item.get('ok')), 'error': item.get('error'),
+            'svg': svg if 'svg' in self.formats else None, 'png': png,
+            'width': item.get('width'), 'height': item.get('height'), 'cached': False
+        }
+
+    def _emit(self, result):
+        self.completed += 1
+        self.rendered.emit(result)
+        if self.callback:
+            self.callback(result)
+        if self.isIdle():
+            self.finished.emit()
+
+    def render_all(self, latexes, timeout=None):
+        """
+        阻塞地渲染全部公式（在命令行等没有运行事件循环的场景中使用）
+        Args:
+            timeout: 超时时间（秒），超时后尚未完成的公式按失败返回；None 表示一直等待
+        Returns:
+            list: 按输入顺序排列的结果
+        """
+        results = {}
+        loop = QEventLoop()
+
+        def collect(result):
+            results[result['index']] = result
+            if len(results) == len(indexes):
+                loop.quit()
+
+        self.rendered.connect(collect)
+        try:
+            indexes = self.submit(latexes)
+            if indexes:
+                timer = QTimer()
+                timer.setSingleShot(True)
+                timer.timeout.connect(lambda: self.abort('渲染超时'))
+                if timeout is not None:
+                    timer.start(int(timeout * 1000))
+                if len(results) < len(indexes):
+                    loop.exec_()
+                timer.stop()
+        finally:
+            self.rendered.disconnect(collect)
+        return [results.get(i) for i in indexes]
+
+    def stats(self):
+        """吞吐量统计（只计算实际排版的时间）"""
+        return {
+            'completed': self.completed,
+            'queued': len(self._queue),
+            'elapsed': self.elapsed,
+            'per_second': self.completed / self.elapsed if self.elapsed else 0.0
+        }
+
+
+def _read_latex_file(path):
+    """每行一个公式，忽略空行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    """
+    命令行批量导出
+
+    运行方式:
+        python -m app.common.batch_render formulas.txt -o export --format svg,png
+        python -m app.common.batch_render --history -o export
+    """
+    parser = argparse.ArgumentParser(description='批量将 LaTeX 公式导出为 SVG/PNG')
+    parser.add_argument('files', nargs='*', help='公式文件，每行一个公式')
+    parser.add_argument('--history', action='store_true', help='导出全部历史记录中的公式')
+    parser.add_argument('-o', '--output', default='export', help='输出目录')
+    parser.add_argument('--format', default='svg,png', help='输出格式，逗号分隔')
+    parser.add_argument('--scale', type=float, default=2.0, help='PNG 缩放比例')
+    parser.add_argument('--batch-size', type=int, default=32, help='每批排版的公式数')
+    parser.add_argument('--timeout', type=float, default=600, help='整体超时时间（秒），0 表示不限制')
+    args = parser.parse_args(argv)
+
+    entries = []  # (文件名前缀, LaTeX)
+    for path in args.files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        entries.extend((f"{stem}_{i:05d}", latex) for i, latex in enumerate(_read_latex_file(path)))
+    if args.history:
+        from ..common.db_manager import DatabaseManager
+        entries.extend((f"history_{record_id}", latex)
+                       for record_id, latex in DatabaseManager().get_all_latex())
+    if not entries:
+        parser.error('没有需要导出的公式')
+
+    # QtWebEngine 要求在创建 QApplication 之前设置
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    formats = tuple(f.strip() for f in args.format.split(',') if f.strip())
+    os.makedirs(args.output, exist_ok=True)
+    failed = []
+
+    def save(result):
+        name = entries[result['index']][0]
+        if not result['ok']:
+            failed.append((name, result['error']))
+        for fmt in formats:
+            data = result.get(fmt)
+            if data:
+                with open(os.path.join(args.output, f"{name}.{fmt}"), 'wb') as f:
+                    f.write(data)
+
+    engine = BatchRenderEngine(app, batch_size=args.batch_size, formats=formats, scale=args.scale, callback=save)
+    start = time.perf_counter()
+    engine.render_all([latex for _, latex in entries], timeout=args.timeout or None)
+    elapsed = time.perf_counter() - start
+
+    print(f"已导出 {len(entries) - len(failed)} / {len(entries)} 个公式到 {args.output}，"
+          f"耗时 {elapsed:.2f} s（{len(entries) / elapsed:.1f} 个/秒）")
+    for name, error in failed:
+        print(f"  {name}: {error}")
+    return 0 if not failed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
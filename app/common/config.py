@@ -70,9 +70,63 @@ class Config(QConfig):
     api_url = ConfigItem("LatexOCR", "ApiUrl", "https://server.simpletex.cn/api/latex_ocr", NonEmptyStringValidator())
     token = ConfigItem("LatexOCR", "Token", "abc" * 10, NonEmptyStringValidator())
 
+    # Simpletex 网络设置（超时单位为秒，退避单位为毫秒）
+    simpletexConnectTimeout = RangeConfigItem("Simpletex", "ConnectTimeout", 5, RangeValidator(1, 60))
+    simpletexReadTimeout = RangeConfigItem("Simpletex", "ReadTimeout", 30, RangeValidator(1, 300))
+    simpletexMaxRetries = RangeConfigItem("Simpletex", "MaxRetries", 2, RangeValidator(0, 10))
+    simpletexRetryBackoff = RangeConfigItem("Simpletex", "RetryBackoff", 500, RangeValidator(0, 10000))
+    simpletexPoolSize = RangeConfigItem("Simpletex", "PoolSize", 4, RangeValidator(1, 32))
+
+    # 上传前预处理
+    preprocessEnabled = ConfigItem("Preprocess", "Enabled", True, BoolValidator())
+    preprocessAutoCrop = ConfigItem("Preprocess", "AutoCrop", True, BoolValidator())
+    preprocessInvert = ConfigItem("Preprocess", "Invert", True, BoolValidator())
+    preprocessGrayscale = ConfigItem("Preprocess", "Grayscale", True, BoolValidator())
+    preprocessContrast = ConfigItem("Preprocess", "Contrast", True, BoolValidator())
+    preprocessDeskew = ConfigItem("Preprocess", "Deskew", True, BoolValidator())
+    # 校正的最大倾斜角度（度）
+    preprocessMaxSkew = RangeConfigItem("Preprocess", "MaxSkew", 5, RangeValidator(1, 15))
+    preprocessDownscale = ConfigItem("Preprocess", "Downscale", True, BoolValidator())
+    preprocessMaxDimension = RangeConfigItem("Preprocess", "MaxDimension", 1600, RangeValidator(256, 8192))
+    preprocessMinGlyphHeight = RangeConfigItem("Preprocess", "MinGlyphHeight", 24, RangeValidator(8, 128))
+    preprocessBinarize = ConfigItem("Preprocess", "Binarize", False, BoolValidator())
+    # 上传前检查空白、纯色、过小的图片
+    preflightEnabled = ConfigItem("Preprocess", "Preflight", True, BoolValidator())
+    # 一张图中有多个公式时分区域识别（每个区域单独计费，默认关闭）
+    layoutDetect = ConfigItem("Preprocess", "LayoutDetect", False, BoolValidator())
+    # 编码选择的时间预算（毫秒）
+    encodeTimeBudget = RangeConfigItem("Preprocess", "EncodeTimeBudget", 20, RangeValidator(0, 500))
+
+    # 识别结果缓存
+    cacheEnabled = ConfigItem("Cache", "Enabled", True, BoolValidator())
+    cacheMaxEntries = RangeConfigItem("Cache", "MaxEntries", 5000, RangeValidator(100, 100000))
+    # 相似图片复用：Off 关闭，Offer 提示用户，Auto 直接使用历史结果
+    nearDuplicateMode = OptionsConfigItem("Cache", "NearDuplicateMode", "Offer", OptionsValidator(["Off", "Offer", "Auto"]))
+    nearDuplicateThreshold = RangeConfigItem("Cache", "NearDuplicateThreshold", 4, RangeValidator(0, 16))
+
+    # 公式渲染：复制图片时四周保留的边距（逻辑像素）和判定为背景的颜色差
+    renderCropPadding = RangeConfigItem("Render", "CropPadding", 5, RangeValidator(0, 100))
+    renderCropTolerance = RangeConfigItem("Render", "CropTolerance", 8, RangeValidator(0, 128))
+    # 渲染缓存容量（MB）
+    renderCacheMemoryMB = RangeConfigItem("Render", "CacheMemoryMB", 32, RangeValidator(1, 1024))
+    renderCacheDiskMB = RangeConfigItem("Render", "CacheDiskMB", 256, RangeValidator(8, 8192))
+
     # 快捷键设置
     screenshotHotkey = ConfigItem("Hotkey", "ScreenshotHotkey", "Ctrl+Alt+S", NonEmptyStringValidator())
 
+    # 截图设置
+    screenshotSaveToDisk = ConfigItem("Screenshot", "SaveToDisk", False, BoolValidator())
+    screenshotMaxFiles = RangeConfigItem("Screenshot", "MaxFiles", 20, RangeValidator(1, 1000))
+    # 拖拽选区停顿时提前开始识别（停顿时间单位为毫秒）
+    screenshotSpeculative = ConfigItem("Screenshot", "Speculative", False, BoolValidator())
+    screenshotSpeculativeDwell = RangeConfigItem("Screenshot", "SpeculativeDwell", 350, RangeValidator(100, 2000))
+    # 截图时检测文本/公式块，单击即可选中
+    screenshotSnap = ConfigItem("Screenshot", "Snap", True, BoolValidator())
+    # 区域监视：抓取间隔（毫秒）、需要稳定的帧数、判定变化的像素比例（千分比）
+    watchInterval = RangeConfigItem("Screenshot", "WatchInterval", 500, RangeValidator(100, 10000))
+    watchStableFrames = RangeConfigItem("Screenshot", "WatchStableFrames", 3, RangeValidator(1, 30))
+    watchChangeRatio = RangeConfigItem("Screenshot", "WatchChangeRatio", 5, RangeValidator(1, 500))
+
 YEAR = 2025
 AUTHOR = "ziuch"
 VERSION = "1.0.0"
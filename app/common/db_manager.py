@@ -3,6 +3,14 @@ import base64
 from datetime import datetime
 import os
 
+
+def decode_image_data(image_data):
+    """读取历史记录中的图片字节（兼容旧版本的 base64 文本）"""
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return bytes(image_data)
+    return base64.b64decode(image_data)
+
+
 class DatabaseManager:
     def __init__(self, db_path='app/data/history.db'):
         self.db_path = db_path
@@ -28,6 +36,14 @@ class DatabaseManager:
                     UNIQUE(request_id)
                 )
             ''')
+
+            # 旧版本数据库没有哈希列，补上
+            cursor.execute("PRAGMA table_info(history)")
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'phash' not in columns:
+                cursor.execute("ALTER TABLE history ADD COLUMN phash TEXT")
+            if 'image_hash' not in columns:
+                cursor.execute("ALTER TABLE history ADD COLUMN image_hash TEXT")
             
             conn.commit()
         except sqlite3.Error as e:
@@ -36,22 +52,24 @@ class DatabaseManager:
             if conn:
                 conn.close()
 
-    def add_record(self, image_data, latex_result, confidence, request_id):
-        """添加记录"""
+    def add_record(self, image_data, latex_result, confidence, request_id, phash=None, image_hash=None):
+        """添加记录
+
+        图片字节（bytes 或 memoryview）直接以 BLOB 保存，不再转换为 base64
+        """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # 将图片转换为base64
-        if isinstance(image_data, bytes):
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            image_blob = sqlite3.Binary(image_data)
         else:
-            image_base64 = image_data
+            image_blob = image_data
             
         try:
             cursor.execute('''
-                INSERT INTO history (timestamp, image_data, latex_result, confidence, request_id)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (datetime.now(), image_base64, latex_result, confidence, request_id))
+                INSERT INTO history (timestamp, image_data, latex_result, confidence, request_id, phash, image_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (datetime.now(), image_blob, latex_result, confidence, request_id, phash, image_hash))
             conn.commit()
             # 获取新插入记录的ID
             record_id = cursor.lastrowid
@@ -61,9 +79,9 @@ class DatabaseManager:
             # 如果request_id已存在，则更新记录
             cursor.execute('''
                 UPDATE history 
-                SET timestamp=?, image_data=?, latex_result=?, confidence=?
+                SET timestamp=?, image_data=?, latex_result=?, confidence=?, phash=?, image_hash=?
                 WHERE request_id=?
-            ''', (datetime.now(), image_base64, latex_result, confidence, request_id))
+            ''', (datetime.now(), image_blob, latex_result, confidence, phash, image_hash, request_id))
             conn.commit()
             # 获取更新记录的ID
             cursor.execute('SELECT id FROM history WHERE request_id=?', (request_id,))
@@ -123,6 +141,58 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
+    def get_record(self, record_id):
+        """获取单条记录"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, timestamp, image_data, latex_result, confidence, request_id
+            FROM history WHERE id=?
+        ''', (record_id,))
+        record = cursor.fetchone()
+
+        conn.close()
+        return record
+
+    def get_phash_records(self):
+        """获取所有记录的感知哈希（缺少哈希的记录同时返回图片数据以便补算）"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, phash, CASE WHEN phash IS NULL THEN image_data END
+            FROM history
+        ''')
+        records = cursor.fetchall()
+
+        conn.close()
+        return records
+
+    def get_all_latex(self):
+        """获取所有非空的识别结果 [(id, latex)]，按时间顺序"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, latex_result FROM history
+            WHERE latex_result IS NOT NULL AND TRIM(latex_result) != ''
+            ORDER BY id
+        ''')
+        records = cursor.fetchall()
+
+        conn.close()
+        return records
+
+    def update_phashes(self, updates):
+        """批量更新感知哈希，updates 为 (phash, record_id) 列表"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.executemany("UPDATE history SET phash=? WHERE id=?", updates)
+        conn.commit()
+        conn.close()
+
     def get_connection(self):
         """获取数据库连接"""
         return sqlite3.connect(self.db_path)
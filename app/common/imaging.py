@@ -0,0 +1,268 @@
+# coding: utf-8
+import sys
+import time
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import Qt, QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QPainter, QPixmap
+
+
+class _QImageArray:
+    """ 通过 __array_interface__ 直接暴露 QImage 的像素内存，并持有 QImage 保证内存有效 """
+
+    def __init__(self, image, offset, shape, strides, typestr='|u1'):
+        self.image = image
+        self.__array_interface__ = {
+            'version': 3,
+            'shape': shape,
+            'typestr': typestr,
+            'data': (int(image.constBits()) + offset, True),
+            'strides': strides,
+        }
+
+
+def _view(image, offset, shape, strides, typestr='|u1'):
+    return np.asarray(_QImageArray(image, offset, shape, strides, typestr))
+
+
+def flatten_alpha(image, background=Qt.white):
+    """将带透明通道的图片合成到纯色背景上，返回 RGB32 格式的 QImage"""
+    opaque = QImage(image.size(), QImage.Format_RGB32)
+    opaque.fill(background)
+    painter = QPainter(opaque)
+    painter.drawImage(0, 0, image)
+    painter.end()
+    return opaque
+
+
+def qimage_to_bgr(image, contiguous=False):
+    """将 QImage 转为 BGR 格式的 NumPy 数组
+
+    常见格式直接返回只读视图，不复制像素；行对齐（bytesPerLine）通过 strides 处理。
+    带透明通道的图片先合成到白色背景上。
+    Args:
+        image: QImage
+        contiguous: 是否需要连续内存，为 True 时在一次拷贝中同时完成去除行填充和通道重排
+    """
+    if image.hasAlphaChannel():
+        # 透明区域按白色处理，否则透明背景上的黑色公式会变成全黑
+        image = flatten_alpha(image)
+
+    fmt = image.format()
+    if sys.byteorder == 'little' and fmt == QImage.Format_RGB32:
+        # 内存中的字节顺序为 B, G, R, X
+        offset, pixel_bytes, channel_step = 0, 4, 1
+    elif fmt in (QImage.Format_RGBX8888, QImage.Format_RGB888):
+        # 内存中的字节顺序为 R, G, B(, X)，从 B 开始反向读取即为 BGR
+        offset, pixel_bytes, channel_step = 2, 3 if fmt == QImage.Format_RGB888 else 4, -1
+    elif fmt == QImage.Format_BGR888:
+        offset, pixel_bytes, channel_step = 0, 3, 1
+    else:
+        return qimage_to_bgr(image.convertToFormat(QImage.Format_RGB32), contiguous)
+
+    arr = _view(image, offset, (image.height(), image.width(), 3),
+                (image.bytesPerLine(), pixel_bytes, channel_step))
+    return np.ascontiguousarray(arr) if contiguous else arr
+
+
+def qimage_to_gray(image):
+    """将 QImage 转为灰度 NumPy 数组（灰度图直接返回视图）"""
+    if image.format() == QImage.Format_Grayscale8:
+        return _view(image, 0, (image.height(), image.width()), (image.bytesPerLine(), 1))
+    return cv2.cvtColor(qimage_to_bgr(image), cv2.COLOR_BGR2GRAY)
+
+
+def content_bbox(image, tolerance=0):
+    """查找图像中非背景内容的包围盒（精确结果）
+
+    背景透明时 alpha 大于 tolerance 的像素为内容，否则任一颜色通道与左上角像素相差超过 tolerance 的像素为内容。
+    直接在像素内存上用 cv2.inRange 一次得到背景掩码，再用 cv2.boundingRect 求出内容的包围盒，
+    不取样，1 像素高的负号这类细小笔画也不会漏掉。
+    Args:
+        image: QImage
+        tolerance: 判定为内容的差异阈值
+    Returns:
+        tuple: (x, y, w, h)，全是背景时返回 None
+    """
+    if sys.byteorder != 'little' or image.format() not in (
+            QImage.Format_RGB32, QImage.Format_ARGB32, QImage.Format_ARGB32_Premultiplied):
+        image = image.convertToFormat(QImage.Format_ARGB32)
+    h, w = image.height(), image.width()
+    if h == 0 or w == 0:
+        return None
+
+    # 内存中的字节顺序为 B, G, R, A
+    pixels = _view(image, 0, (h, w, 4), (image.bytesPerLine(), 4, 1))
+    b, g, r, a = (int(v) for v in pixels[0, 0])
+    # 截图得到的图像通常带透明通道但完全不透明，此时按颜色判断
+    if image.hasAlphaChannel() and a < 255:
+        lower, upper = (0, 0, 0, 0), (255, 255, 255, tolerance)
+    else:
+        lower = tuple(max(0, v - tolerance) for v in (b, g, r)) + (0,)
+        upper = tuple(min(255, v + tolerance) for v in (b, g, r)) + (255,)
+
+    background = cv2.inRange(pixels, np.array(lower, np.uint8), np.array(upper, np.uint8))
+    x, y, bw, bh = cv2.boundingRect(cv2.bitwise_not(background))
+    if bw == 0 or bh == 0:
+        return None
+    return x, y, bw, bh
+
+
+def qpixmap_to_bgr(pixmap, contiguous=False):
+    """将 QPixmap 转为 BGR 格式的 NumPy 数组"""
+    return qimage_to_bgr(pixmap.toImage(), contiguous)
+
+
+def array_to_qimage(array, copy=False):
+    """将 NumPy 数组包装为 QImage
+
+    默认不复制像素，返回的 QImage 会持有数组的引用；需要长期保存或跨线程使用时传入 copy=True。
+    Args:
+        array: 灰度、BGR 或 BGRA 格式的 uint8 数组
+    """
+    array = np.asarray(array, dtype=np.uint8)
+    if array.ndim == 2:
+        fmt = QImage.Format_Grayscale8
+    elif array.shape[2] == 3:
+        fmt = QImage.Format_BGR888
+    elif array.shape[2] == 4 and sys.byteorder == 'little':
+        fmt = QImage.Format_ARGB32
+    else:
+        raise ValueError(f'Unsupported array shape: {array.shape}')
+
+    # QImage 要求像素在行内连续，行之间可以有填充
+    if array.strides[-1] != 1 or (array.ndim == 3 and array.strides[1] != array.shape[2]):
+        array = np.ascontiguousarray(array)
+
+    h, w = array.shape[:2]
+    image = QImage(array.data, w, h, array.strides[0], fmt)
+    if copy:
+        return image.copy()
+    image._array = array  # 保证像素内存与 QImage 生命周期一致
+    return image
+
+
+def array_to_qpixmap(array):
+    """将 NumPy 数组转为 QPixmap（QPixmap 总会复制一份像素）"""
+    return QPixmap.fromImage(array_to_qimage(array))
+
+
+def decode_image(data, flags=cv2.IMREAD_COLOR):
+    """将编码后的图片字节解码为 NumPy 数组（不复制输入）"""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+def pixmap_from_bytes(data):
+    """将编码后的图片字节解码为 QPixmap"""
+    pixmap = QPixmap()
+    pixmap.loadFromData(bytes(data) if isinstance(data, memoryview) else data)
+    return pixmap
+
+
+def pixmap_to_bytes(pixmap, fmt='PNG'):
+    """将 QPixmap 或 QImage 编码为图片字节"""
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    pixmap.save(buffer, fmt)
+    buffer.close()
+    return bytes(data)
+
+
+def _legacy_qimage_to_bgr(image):
+    """旧版转换方式，仅用于基准测试对比"""
+    image = image.convertToFormat(QImage.Format_RGBA8888)
+    ptr = image.bits()
+    ptr.setsize(image.height() * image.width() * 4)
+    arr = np.frombuffer(ptr, np.uint8).reshape((image.height(), image.width(), 4))
+    return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGR)
+
+
+def _legacy_content_bounds(image):
+    """旧版 LaTeXRenderer.get_image 的逐像素裁剪（只裁左右），仅用于基准测试对比"""
+    rect = image.rect()
+    for x in range(rect.left(), rect.right()):
+        for y in range(rect.top(), rect.bottom()):
+            if image.pixelColor(x, y).alpha() > 0:
+                rect.setLeft(max(0, x - 5))
+                break
+        else:
+            continue
+        break
+
+    for x in range(rect.right(), rect.left(), -1):
+        for y in range(rect.top(), rect.bottom()):
+            if image.pixelColor(x, y).alpha() > 0:
+                rect.setRight(min(image.width(), x + 5))
+                break
+        else:
+            continue
+        break
+    return rect
+
+
+def benchmark_crop(sizes=((1200, 300), (2400, 600), (3840, 2160)), repeat=20):
+    """裁剪包围盒的性能对比
+
+    分别测试透明背景（走 alpha 判断）和 get_image 实际使用的不透明白色背景 + 容差，
+    内容为中间一个公式大小的块，以及左侧远离主体的一条 1 像素高的横线（负号）。
+    """
+    for width, height in sizes:
+        print(f"crop {width}x{height}")
+        images = {}
+        for name, fmt, fill, tolerance in (
+                ('transparent', QImage.Format_ARGB32_Premultiplied, Qt.transparent, 0),
+                ('opaque, tolerance=8', QImage.Format_ARGB32_Premultiplied, Qt.white, 8)):
+            image = QImage(width, height, fmt)
+            image.fill(fill)
+            painter = QPainter(image)
+            painter.fillRect(width // 2, height // 3, width // 6, height // 3, Qt.black)
+            painter.fillRect(width // 8, height // 2 + 1, width // 20, 1, Qt.black)
+            painter.end()
+            images[name] = image
+
+            expected = (width // 8, height // 3, width // 2 + width // 6 - width // 8, height // 3)
+            bbox = content_bbox(image, tolerance)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                content_bbox(image, tolerance)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            status = 'ok' if bbox == expected else f'MISMATCH {bbox} != {expected}'
+            print(f"  content_bbox ({name:<20}) {elapsed:10.3f} ms  {status}")
+
+        # 逐像素循环非常慢，只运行一次
+        start = time.perf_counter()
+        _legacy_content_bounds(images['transparent'])
+        print(f"  {'legacy pixelColor loop':<35} {(time.perf_counter() - start) * 1000:10.3f} ms")
+
+
+def benchmark(width=3840, height=2160, repeat=20):
+    """转换性能基准测试
+
+    运行方式: python -m app.common.imaging
+    """
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(Qt.white)
+    cases = [
+        ('legacy bits() + cvtColor', lambda: _legacy_qimage_to_bgr(image)),
+        ('qimage_to_bgr (view)', lambda: qimage_to_bgr(image)),
+        ('qimage_to_bgr (contiguous)', lambda: qimage_to_bgr(image, contiguous=True)),
+        ('qimage_to_gray', lambda: qimage_to_gray(image)),
+    ]
+    bgr = qimage_to_bgr(image, contiguous=True)
+    cases.append(('array_to_qimage (view)', lambda: array_to_qimage(bgr)))
+
+    print(f"{width}x{height}, {repeat} runs")
+    for name, func in cases:
+        func()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        print(f"  {name:<30} {elapsed:8.3f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
+    benchmark_crop()
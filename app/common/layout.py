@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+
+from ..common.preprocess import to_gray, ink_mask, estimate_glyph_height
+
+
+def split_rows(mask, min_gap):
+    """
+    按水平投影切分文本行
+    Returns:
+        list: [(top, bottom)]，bottom 不包含
+    """
+    has_ink = mask.any(axis=1)
+    # 找出连续有墨迹的行段
+    padded = np.concatenate(([False], has_ink, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    runs = edges.reshape(-1, 2)
+    if runs.size == 0:
+        return []
+
+    # 间隔小于 min_gap 的行段合并（上下标、分数线等）
+    merged = [list(runs[0])]
+    for top, bottom in runs[1:]:
+        if top - merged[-1][1] < min_gap:
+            merged[-1][1] = bottom
+        else:
+            merged.append([top, bottom])
+    return [(int(t), int(b)) for t, b in merged]
+
+
+def detect_formula_regions(image_data, max_side=2000, min_area_ratio=0.0005, padding=6, row_gap=1.5):
+    """
+    检测图像中的各个公式区域
+
+    只在行间距明显大于字符高度的地方按水平投影切分，每个行段整体作为一个区域，
+    行内不再拆分。分数、上下标、多行 align 环境的行距都小于阈值，不会被拆开。
+    Args:
+        image_data: OpenCV 格式的图像
+        max_side: 检测时将图像缩小到的最长边，结果会映射回原图坐标
+        min_area_ratio: 面积小于原图该比例的区域视为噪点
+        padding: 每个区域四周额外保留的像素
+        row_gap: 切分所需的最小行间距（相对于字符高度）
+    Returns:
+        list: [(x, y, w, h)]，从上到下排列
+    """
+    gray = to_gray(image_data)
+    h, w = gray.shape
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    mask = ink_mask(gray)
+    sh, sw = mask.shape
+
+    glyph = estimate_glyph_height(mask) or 10.0
+    min_gap = max(4, int(glyph * row_gap))
+    min_area = min_area_ratio * sh * sw
+
+    boxes = []
+    for top, bottom in split_rows(mask, min_gap):
+        cols = np.flatnonzero(mask[top:bottom].any(axis=0))
+        x, bw, bh = int(cols[0]), int(cols[-1] - cols[0] + 1), bottom - top
+        if bw * bh >= min_area:
+            boxes.append((x, top, bw, bh))
+
+    # 映射回原图坐标并加边距
+    regions = []
+    for x, y, bw, bh in boxes:
+        x0 = max(0, int(x / scale) - padding)
+        y0 = max(0, int(y / scale) - padding)
+        x1 = min(w, int(np.ceil((x + bw) / scale)) + padding)
+        y1 = min(h, int(np.ceil((y + bh) / scale)) + padding)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
+
+
+def formula_density(image_data):
+    """
+    估计区域中具有公式特征的字符所占的比例，用于区分公式和普通文字行
+
+    公式特征包括：分数线、等号、减号这类扁平横线；积分号、求和号、大括号这类明显高于
+    普通字符的符号；偏离基线的小号上下标。普通文字行中的字符高度相近、底部对齐，
+    i、j 的点和标点太小，不计入。
+    Returns:
+        float: 0 ~ 1
+    """
+    mask = ink_mask(to_gray(image_data))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:count]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] > 4]
+    if not len(stats):
+        return 0.0
+
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    bottoms = stats[:, cv2.CC_STAT_TOP] + heights
+    upright = heights * 3 >= widths
+    if not upright.any():
+        return 0.0
+    glyph = float(np.median(heights[upright]))
+    baseline = float(np.median(bottoms[upright]))
+
+    flat = ~upright & (widths >= glyph * 0.5)
+    tall = heights > glyph * 2.0
+    script = (upright & (heights >= glyph * 0.35) & (heights < glyph * 0.8)
+              & (np.abs(bottoms - baseline) > glyph * 0.35))
+    return np.count_nonzero(flat | tall | script) / len(stats)
+
+
+def crop_regions(image_data, regions):
+    """按区域裁剪（返回视图，不复制）"""
+    return [image_data[y:y + h, x:x + w] for x, y, w, h in regions]
+
+
+def detect_text_blocks(gray, target_width=960, min_size=6, padding=3):
+    """
+    快速检测屏幕截图中的文本/公式块，用于截图时的吸附选区
+
+    在缩小的灰度图上用形态学梯度提取笔画边缘，Otsu 二值化后水平闭运算把字符连成块，
+    再用连通域统计一次性得到所有候选框，过滤全部向量化完成。
+    Args:
+        gray: 灰度图像
+        target_width: 检测时缩小到的宽度
+        min_size: 缩小图上候选框的最小宽高
+        padding: 候选框四周额外保留的像素（原图坐标）
+    Returns:
+        np.ndarray: N x 4 的 (x, y, w, h)，原图坐标
+    """
+    h, w = gray.shape
+    scale = min(1.0, target_width / max(1, w))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    sh, sw = gray.shape
+
+    ellipse = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, ellipse)
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 3)))
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(closed, connectivity=8)
+    stats = stats[1:count]
+    bw = stats[:, cv2.CC_STAT_WIDTH]
+    bh = stats[:, cv2.CC_STAT_HEIGHT]
+    fill = stats[:, cv2.CC_STAT_AREA] / np.maximum(1, bw * bh)
+    # 去掉过小的噪点、接近整屏的大块，以及填充率很低的窗口边框和分隔线
+    keep = ((bw >= min_size) & (bh >= min_size) & (bh <= sh * 0.5) & (bw <= sw * 0.9) & (fill >= 0.2))
+    boxes = stats[keep, :4].astype(np.float32)
+
+    # 映射回原图坐标并加边距
+    x0 = np.maximum(0, np.floor(boxes[:, 0] / scale) - padding)
+    y0 = np.maximum(0, np.floor(boxes[:, 1] / scale) - padding)
+    x1 = np.minimum(w, np.ceil((boxes[:, 0] + boxes[:, 2]) / scale) + padding)
+    y1 = np.minimum(h, np.ceil((boxes[:, 1] + boxes[:, 3]) / scale) + padding)
+    return np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).astype(np.int32)
@@ -0,0 +1,66 @@
+# coding: utf-8
+import os
+
+from PyQt5.QtCore import QUrl
+
+
+# 相对于本模块定位资源目录，不依赖当前工作目录（打包后位于 PyInstaller 的解压目录中）
+MATHJAX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resource', 'mathjax')
+MATHJAX_SCRIPT = 'tex-svg.js'
+MATHJAX_CDN = 'https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-svg.js'
+PAGE_TEMPLATE = 'renderer.html'
+
+_page_html = None
+
+
+def local_script_path():
+    return os.path.join(MATHJAX_DIR, MATHJAX_SCRIPT)
+
+
+def has_local_script():
+    """本地是否已有 MathJax（离线可用）"""
+    return os.path.isfile(local_script_path())
+
+
+def base_url():
+    """渲染页面的 baseUrl，页面中的相对路径指向本地 MathJax 目录"""
+    return QUrl.fromLocalFile(os.path.abspath(MATHJAX_DIR) + os.sep)
+
+
+def page_html():
+    """
+    常驻渲染页面的 HTML（只读取一次）
+
+    优先使用本地的 MathJax，本地没有时退回 CDN。
+    """
+    global _page_html
+    if _page_html is None:
+        with open(os.path.join(MATHJAX_DIR, PAGE_TEMPLATE), 'r', encoding='utf-8') as f:
+            template = f.read()
+        src = MATHJAX_SCRIPT if has_local_script() else MATHJAX_CDN
+        _page_html = template.replace('__MATHJAX_SRC__', src)
+    return _page_html
+
+
+def download(url=MATHJAX_CDN, path=None, timeout=30):
+    """
+    下载 MathJax 到本地资源目录，之后渲染不再依赖网络
+
+    运行方式: python -m app.common.mathjax
+    """
+    import requests
+
+    path = path or local_script_path()
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(response.content)
+    os.replace(tmp, path)
+    return path
+
+
+if __name__ == '__main__':
+    print(f"MathJax 已保存到 {download()}")
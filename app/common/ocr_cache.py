@@ -0,0 +1,261 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ..common.db_manager import decode_image_data
+from ..common.imaging import decode_image
+
+
+def normalize_image(image_data):
+    """将图像统一为连续内存的 BGR uint8 数组，保证同一张图得到相同的哈希"""
+    img = np.asarray(image_data)
+    if img.dtype != np.uint8:
+        img = img.astype(np.uint8)
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return np.ascontiguousarray(img)
+
+
+def image_key(image_data):
+    """计算图像像素内容的哈希（包含尺寸，避免不同形状的相同字节冲突）"""
+    img = normalize_image(image_data)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.shape[0]}x{img.shape[1]}".encode())
+    h.update(memoryview(img).cast('B'))
+    return h.hexdigest()
+
+
+class RecognitionCache:
+    """ 以图像内容哈希为键的识别结果缓存
+
+    内存中保存一份 LRU 表用于快速命中，SQLite 负责持久化。
+    首次启动时会从历史记录表中导入已识别过的图片。
+    """
+
+    def __init__(self, db_path='app/data/ocr_cache.db', history_db_path='app/data/history.db',
+                 max_entries=5000):
+        self.db_path = db_path
+        self.history_db_path = history_db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (latex, confidence, request_id)
+        self._touched = {}             # key -> 最近访问时间（尚未写回数据库）
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.init_db()
+        self.load()
+        self.seed_from_history()
+
+    def init_db(self):
+        """初始化缓存数据库"""
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    image_hash TEXT PRIMARY KEY,
+                    latex_result TEXT NOT NULL,
+                    confidence REAL NOT NULL,
+                    request_id TEXT,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used)')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"缓存数据库初始化错误: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+    def load(self):
+        """按最近使用顺序将缓存加载到内存"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT image_hash, latex_result, confidence, request_id
+                FROM ocr_cache ORDER BY last_used DESC LIMIT ?
+            ''', (self.max_entries,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._entries.clear()
+            # 查询结果是从新到旧，倒序插入后末尾为最近使用
+            for image_hash, latex, confidence, request_id in reversed(rows):
+                self._entries[image_hash] = (latex, confidence, request_id)
+
+    def seed_from_history(self):
+        """从历史记录中导入尚未缓存的识别结果（只处理上次导入之后的新记录）"""
+        if not os.path.exists(self.history_db_path):
+            return
+
+        last_id = int(self._get_meta('seeded_history_id', 0))
+        try:
+            conn = sqlite3.connect(self.history_db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, image_hash, CASE WHEN image_hash IS NULL THEN image_data END,
+                           latex_result, confidence, request_id
+                    FROM history WHERE id > ? ORDER BY id
+                ''', (last_id,))
+                rows = cursor.fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"读取历史记录失败: {e}")
+            return
+
+        entries = []
+        for record_id, key, image_data, latex, confidence, request_id in rows:
+            last_id = max(last_id, record_id)
+            if key:
+                # 新记录直接保存了内容哈希，无需解码图片
+                entries.append((key, latex, confidence, request_id))
+                continue
+            try:
+                img = decode_image(decode_image_data(image_data), cv2.IMREAD_COLOR)
+                if img is None:
+                    continue
+                entries.append((image_key(img), latex, confidence, request_id))
+            except Exception as e:
+                print(f"导入历史记录 {record_id} 失败: {e}")
+
+        if entries:
+            self._put_many(entries)
+            print(f"已从历史记录导入 {len(entries)} 条缓存")
+        self._set_meta('seeded_history_id', last_id)
+
+    def get(self, key):
+        """查询缓存，命中时返回识别结果字典"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._touched[key] = time.time()
+            self.hits += 1
+
+        latex, confidence, request_id = entry
+        return {
+            'status': True,
+            'latex': latex,
+            'confidence': confidence,
+            'request_id': request_id,
+            'message': None,
+            'cached': True
+        }
+
+    def put(self, key, result):
+        """写入识别成功的结果"""
+        if not result.get('status'):
+            return
+        self._put_many([(key, result['latex'], result['confidence'], result['request_id'])])
+
+    def _put_many(self, entries):
+        now = time.time()
+        with self._lock:
+            for key, latex, confidence, request_id in entries:
+                self._entries[key] = (latex, confidence, request_id)
+                self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            touched = [(t, k) for k, t in self._touched.items() if k in self._entries]
+            self._touched.clear()
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR REPLACE INTO ocr_cache (image_hash, latex_result, confidence, request_id, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(k, l, c, r, now) for k, l, c, r in entries])
+            # 顺便写回最近命中的访问时间
+            cursor.executemany('UPDATE ocr_cache SET last_used=? WHERE image_hash=?', touched)
+            cursor.executemany('DELETE FROM ocr_cache WHERE image_hash=?', [(k,) for k in evicted])
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"写入识别缓存失败: {e}")
+        finally:
+            conn.close()
+
+    def flush(self):
+        """将内存中的访问时间写回数据库"""
+        with self._lock:
+            touched = [(t, k) for k, t in self._touched.items()]
+            self._touched.clear()
+        if not touched:
+            return
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany('UPDATE ocr_cache SET last_used=? WHERE image_hash=?', touched)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+            self.hits = 0
+            self.misses = 0
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('DELETE FROM ocr_cache')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def _get_meta(self, key, default=None):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT value FROM cache_meta WHERE key=?', (key,))
+            row = cursor.fetchone()
+            return row[0] if row else default
+        finally:
+            conn.close()
+
+    def _set_meta(self, key, value):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)', (key, str(value)))
+            conn.commit()
+        finally:
+            conn.close()
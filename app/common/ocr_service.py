@@ -1,17 +1,196 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import itertools
+import random
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import cv2
+import numpy as np
 from ..common.config import cfg
+from ..common.layout import detect_formula_regions, crop_regions
+from ..common.ocr_cache import RecognitionCache
+from ..common.preprocess import PreprocessPipeline
+from ..common.prepared_image import PreparedImage
+
+
+class HttpClient:
+    """带连接池、超时和重试的HTTP客户端
+
+    同一个服务实例内共享一个 requests.Session，复用 TCP/TLS 连接（keep-alive）。
+    Session 的连接池本身是线程安全的，可以被多个识别线程同时使用。
+    """
+
+    # 触发重试的状态码
+    RETRY_STATUS = (500, 502, 503, 504)
+
+    def __init__(self, connect_timeout=5, read_timeout=30, max_retries=2,
+                 backoff=0.5, pool_size=4, max_backoff=8.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """延迟创建共享的 Session"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        session = requests.Session()
+        # 重试由 post() 自行处理（带抖动的指数退避），这里关闭 urllib3 的重试
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+            pool_block=False
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Connection': 'keep-alive'})
+        return session
+
+    def _sleep_before_retry(self, attempt):
+        """指数退避 + 全抖动，避免多个请求同时重试"""
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def post(self, url, **kwargs):
+        """发送 POST 请求，5xx 和连接错误时自动重试
+
+        读取超时（ReadTimeout）不重试：请求可能已被服务端处理，重发会重复计费。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.ConnectionError:
+                # 包括连接超时（ConnectTimeout）和连接被重置
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUS or last_attempt:
+                    return response
+                response.close()
+
+            self._sleep_before_retry(attempt)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class ImageEncoder:
+    """上传编码选择器
+
+    在时间预算内尝试多种无损编码，选出服务商接受的最小结果。
+    """
+
+    MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+
+    def __init__(self, accepted_formats=('png',), time_budget_ms=20, min_bytes=8 * 1024):
+        self.accepted_formats = accepted_formats
+        self.time_budget_ms = time_budget_ms
+        self.min_bytes = min_bytes  # 小于该大小时不再尝试其他编码，收益太小
+
+    @staticmethod
+    def is_bilevel(image_data):
+        """是否为纯黑白图像（可以使用 1 位 PNG）"""
+        return image_data.ndim == 2 and not np.any((image_data != 0) & (image_data != 255))
+
+    def candidates(self, image_data):
+        """按预期收益从高到低排列的候选编码 (名称, 格式, 参数)"""
+        result = []
+        if self.is_bilevel(image_data):
+            result.append(('png-1bit', 'png', [cv2.IMWRITE_PNG_BILEVEL, 1, cv2.IMWRITE_PNG_COMPRESSION, 9]))
+        if 'webp' in self.accepted_formats:
+            # 质量大于 100 时为无损 WebP
+            result.append(('webp-lossless', 'webp', [cv2.IMWRITE_WEBP_QUALITY, 101]))
+        result.append(('png-9', 'png', [cv2.IMWRITE_PNG_COMPRESSION, 9]))
+        return result
+
+    def encode(self, image_data):
+        """
+        编码图像
+        Returns:
+            tuple: (编码后的只读字节视图, 格式, MIME 类型, 统计信息)
+        """
+        start = time.perf_counter()
+        _, buf = cv2.imencode('.png', image_data, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        best = (buf, 'png-1', 'png')
+        baseline_bytes = len(buf)
+
+        if baseline_bytes >= self.min_bytes:
+            for name, fmt, params in self.candidates(image_data):
+                if (time.perf_counter() - start) * 1000 >= self.time_budget_ms:
+                    break
+                try:
+                    ok, buf = cv2.imencode(f'.{fmt}', image_data, params)
+                except cv2.error:
+                    continue
+                if ok and len(buf) < len(best[0]):
+                    best = (buf, name, fmt)
+
+        data, name, fmt = best
+        data = data.reshape(-1)
+        data.flags.writeable = False
+        stats = {
+            'encoding': name,
+            'baseline_bytes': baseline_bytes,
+            'upload_bytes': len(data),
+            'saved_bytes': baseline_bytes - len(data),
+            'encode_ms': (time.perf_counter() - start) * 1000
+        }
+        return memoryview(data), fmt, self.MIME_TYPES[fmt], stats
+
 
 class BaseOcrService(ABC):
     """公式识别服务的抽象基类"""
+
+    # 服务商接受的上传格式
+    accepted_formats = ('png',)
+
+    def preprocess_image(self, image_data):
+        """上传前的预处理，默认不做处理，返回 (图像, 统计信息)"""
+        return image_data, {}
+
+    def encode_image(self, image_data):
+        """将原始图像预处理并编码为上传数据"""
+        image_data, stats = self.preprocess_image(image_data)
+        data, fmt, mime, encode_stats = ImageEncoder(self.accepted_formats).encode(image_data)
+        stats.update(encode_stats)
+        return data, fmt, mime, stats
+
+    def prepare(self, image_data):
+        """
+        将图像包装为 PreparedImage，上传、缓存和历史记录共用同一份编码结果
+        Args:
+            image_data: OpenCV格式的图像数据或 PreparedImage
+        Returns:
+            PreparedImage
+        """
+        if isinstance(image_data, PreparedImage):
+            return image_data
+        return PreparedImage(image_data, self.encode_image)
     
     @abstractmethod
     def recognize(self, image_data):
         """
         识别图片中的公式
         Args:
-            image_data: OpenCV格式的图像数据
+            image_data: OpenCV格式的图像数据或 PreparedImage
         Returns:
             dict: {
                 'status': bool,      # 识别是否成功
@@ -23,20 +202,147 @@ class BaseOcrService(ABC):
         """
         pass
 
+    def recognize_batch(self, images, max_concurrency=4):
+        """
+        批量识别图片，结果按完成顺序逐个返回
+        默认实现使用线程池并发调用 recognize，同时在途的请求数不超过 max_concurrency；
+        支持原生批量接口的服务商可以重写此方法。
+        Args:
+            images: 图像的可迭代对象（可以是生成器，按需读取）
+            max_concurrency: 最大并发数
+        Yields:
+            tuple: (index, result)，index 为图片在输入中的序号，
+                   result 格式同 recognize，单张失败不影响其他图片
+        """
+        max_concurrency = max(1, int(max_concurrency))
+        executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        pending = {}
+        try:
+            for index, image_data in enumerate(images):
+                # 在途请求达到上限时，先返回已完成的结果
+                while len(pending) >= max_concurrency:
+                    yield from self._collect_done(pending)
+                pending[executor.submit(self.recognize, image_data)] = index
+
+            while pending:
+                yield from self._collect_done(pending)
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的请求
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def recognize_regions(self, image_data, max_concurrency=4, regions=None):
+        """
+        检测图像中的各个公式区域并并发识别
+        Args:
+            image_data: OpenCV格式的图像数据或 PreparedImage
+            max_concurrency: 最大并发数
+            regions: 已经检测好的区域，不传则重新检测
+        Returns:
+            list: 按阅读顺序排列的 [{'bbox': (x, y, w, h), 'result': dict, 'image': PreparedImage}]
+        """
+        pixels = image_data.pixels if isinstance(image_data, PreparedImage) else image_data
+        if regions is None:
+            regions = detect_formula_regions(pixels)
+        images = [self.prepare(crop) for crop in crop_regions(pixels, regions)]
+
+        results = [None] * len(images)
+        for index, result in self.recognize_batch(images, max_concurrency):
+            results[index] = result
+        return [
+            {'bbox': bbox, 'result': result, 'image': image}
+            for bbox, result, image in zip(regions, results, images)
+        ]
+
+    def recognize_layout(self, image_data, max_concurrency=4):
+        """
+        自动判断单公式还是多公式：检测到多个区域时分别识别，否则整张识别
+        Returns:
+            dict: 格式同 recognize；多公式时额外包含 'regions'（见 recognize_regions），
+                  'latex' 为按顺序合并的 gathered 环境
+        """
+        image = self.prepare(image_data)
+        # 先只做检测，单个区域时整张识别一次，不再为裁剪后的区域额外请求
+        bboxes = detect_formula_regions(image.pixels)
+        if len(bboxes) < 2:
+            return self.recognize(image)
+        regions = self.recognize_regions(image, max_concurrency, bboxes)
+
+        succeeded = [r['result'] for r in regions if r['result']['status']]
+        failed = [r['result']['message'] for r in regions if not r['result']['status']]
+        if not succeeded:
+            return {
+                'status': False,
+                'latex': None,
+                'confidence': 0,
+                'request_id': None,
+                'message': failed[0],
+                'regions': regions
+            }
+
+        body = ' \\\\\n'.join(r['latex'] for r in succeeded)
+        return {
+            'status': True,
+            'latex': f'\\begin{{gathered}}\n{body}\n\\end{{gathered}}',
+            'confidence': min(r['confidence'] for r in succeeded),
+            'request_id': None,
+            'message': f'{len(failed)} 个区域识别失败' if failed else None,
+            'regions': regions
+        }
+
+    @staticmethod
+    def _collect_done(pending):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {
+                    'status': False,
+                    'latex': None,
+                    'confidence': 0,
+                    'request_id': None,
+                    'message': str(e)
+                }
+            yield index, result
+
 class SimpletexService(BaseOcrService):
     """Simpletex的公式识别服务实现"""
+
+    def __init__(self):
+        self.http = HttpClient(
+            connect_timeout=cfg.simpletexConnectTimeout.value,
+            read_timeout=cfg.simpletexReadTimeout.value,
+            max_retries=cfg.simpletexMaxRetries.value,
+            backoff=cfg.simpletexRetryBackoff.value / 1000,
+            pool_size=cfg.simpletexPoolSize.value
+        )
+        self.preprocess = PreprocessPipeline.from_config()
+        self.encoder = ImageEncoder(self.accepted_formats, cfg.encodeTimeBudget.value)
+
+    def preprocess_image(self, image_data):
+        # 裁边、灰度、缩放等，减小上传体积
+        return self.preprocess.run(image_data)
+
+    def encode_image(self, image_data):
+        image_data, stats = self.preprocess_image(image_data)
+        # 选择体积最小的编码
+        data, fmt, mime, encode_stats = self.encoder.encode(image_data)
+        stats.update(encode_stats)
+        return data, fmt, mime, stats
     
     def recognize(self, image_data):
         try:
-            # 将图像编码为二进制
-            _, img_encoded = cv2.imencode('.png', image_data)
+            image = self.prepare(image_data)
             
-            # 构造请求参数
-            files = [('file', ('formula.png', img_encoded.tobytes(), 'image/png'))]
+            # 构造请求参数（直接使用编码好的缓冲区，不再复制）
+            files = [('file', (image.filename, image.data, image.mime))]
             headers = {'token': cfg.token.value}
             
-            # 发送请求
-            response = requests.post(
+            # 发送请求（复用连接池）
+            response = self.http.post(
                 cfg.api_url.value,
                 files=files,
                 headers=headers
@@ -52,7 +358,8 @@ class SimpletexService(BaseOcrService):
                     'latex': res_data.get('latex', ''),
                     'confidence': float(res_data.get('conf', 0)),
                     'request_id': result.get('request_id', ''),
-                    'message': None
+                    'message': None,
+                    'stats': image.stats
                 }
             else:
                 return {
@@ -72,6 +379,55 @@ class SimpletexService(BaseOcrService):
                 'message': str(e)
             }
 
+class CachedOcrService(BaseOcrService):
+    """在识别服务前增加一层内容哈希缓存，相同图片不再重复请求"""
+
+    def __init__(self, service, cache):
+        self.service = service
+        self.cache = cache
+
+    def prepare(self, image_data):
+        return self.service.prepare(image_data)
+
+    def recognize(self, image_data):
+        image = self.prepare(image_data)
+        result = self.cache.get(image.key)
+        if result is not None:
+            return result
+
+        result = self.service.recognize(image)
+        self.cache.put(image.key, result)
+        return result
+
+    def recognize_batch(self, images, max_concurrency=4):
+        """先查缓存，只把未命中的图片交给被包装服务的批量接口"""
+        keys = {}  # 内层批量序号 -> (输入序号, 缓存键)
+        counter = itertools.count()
+
+        def misses():
+            for index, image_data in enumerate(images):
+                image = self.prepare(image_data)
+                result = self.cache.get(image.key)
+                if result is not None:
+                    hits.append((index, result))
+                    continue
+                keys[next(counter)] = (index, image.key)
+                yield image
+
+        hits = []
+        for sub_index, result in self.service.recognize_batch(misses(), max_concurrency):
+            yield from hits
+            hits.clear()
+            index, key = keys.pop(sub_index)
+            self.cache.put(key, result)
+            yield index, result
+        yield from hits
+
+    def __getattr__(self, name):
+        # 其余属性直接转发给被包装的服务
+        return getattr(self.service, name)
+
+
 class OcrServiceFactory:
     """公式识别服务工厂类"""
     
@@ -85,7 +441,12 @@ class OcrServiceFactory:
         service_type = cfg.type.value
         
         if service_type == 'Simpletex':
-            return SimpletexService()
+            service = SimpletexService()
         # 在这里添加其他服务的实现
         else:
-            raise ValueError(f'Unsupported OCR service type: {service_type}') 
\ No newline at end of file
+            raise ValueError(f'Unsupported OCR service type: {service_type}')
+
+        if cfg.cacheEnabled.value:
+            cache = RecognitionCache(max_entries=cfg.cacheMaxEntries.value)
+            service = CachedOcrService(service, cache)
+        return service 
\ No newline at end of file
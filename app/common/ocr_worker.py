@@ -0,0 +1,147 @@
+# coding: utf-8
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class OcrTaskSignals(QObject):
+    """ 识别任务信号（QRunnable 本身不能发信号） """
+
+    finished = pyqtSignal(int, object, object)  # 任务ID, 识别结果, PreparedImage
+
+
+class OcrTask(QRunnable):
+    """ 在线程池中执行的单次识别任务 """
+
+    def __init__(self, job_id, service, image_data, layout=False):
+        super().__init__()
+        self.job_id = job_id
+        self.service = service
+        self.image_data = image_data
+        self.layout = layout
+        self.signals = OcrTaskSignals()
+        self._cancelled = threading.Event()
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        """标记任务已取消（正在进行的网络请求无法中断，但结果会被丢弃）"""
+        self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    def encode_for_history(self, result):
+        """识别成功时在后台线程中编码要保存到历史记录的原图，界面线程只负责写库"""
+        if not result or not result.get('status'):
+            return
+        if 'regions' in result:
+            for region in result['regions']:
+                if region['result']['status']:
+                    region['image'].source_data
+        else:
+            self.image_data.source_data
+
+    def run(self):
+        result = None
+        try:
+            if not self.isCancelled():
+                # 在后台线程中完成哈希和编码，结果随信号一起交给界面保存历史
+                self.image_data = self.service.prepare(self.image_data)
+                if self.layout:
+                    result = self.service.recognize_layout(self.image_data)
+                else:
+                    result = self.service.recognize(self.image_data)
+                self.encode_for_history(result)
+        except Exception as e:
+            result = {
+                'status': False,
+                'latex': None,
+                'confidence': 0,
+                'request_id': None,
+                'message': str(e)
+            }
+        finally:
+            # 无论是否取消都要通知调度器，以便释放任务引用
+            self.signals.finished.emit(self.job_id, result, self.image_data)
+
+
+class OcrWorker(QObject):
+    """ 识别任务调度器
+
+    所有识别请求都在后台线程中执行，结果通过信号回到主线程。
+    新任务提交时会取消尚未返回的旧任务，保证旧结果不会覆盖新结果。
+    """
+
+    started = pyqtSignal(int)                    # 任务ID
+    finished = pyqtSignal(int, object, object)   # 任务ID, 识别结果, PreparedImage
+    cancelled = pyqtSignal(int)                  # 任务ID
+
+    def __init__(self, service, parent=None, max_thread_count=2):
+        super().__init__(parent)
+        self.service = service
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_thread_count)
+        self._job_id = 0
+        self._current = None
+        self._tasks = {}  # 任务ID -> 任务，保持引用直到线程执行完毕
+
+    def setService(self, service):
+        """更换识别服务（仅影响之后提交的任务）"""
+        self.service = service
+
+    def submit(self, image_data, layout=False):
+        """提交识别任务，并取代当前正在进行的任务
+
+        Args:
+            image_data: OpenCV格式的图像数据或 PreparedImage
+            layout: 是否先检测多个公式区域再分别识别
+        Returns:
+            int: 新任务的ID
+        """
+        self.cancel()
+
+        self._job_id += 1
+        task = OcrTask(self._job_id, self.service, image_data, layout)
+        task.signals.finished.connect(self._on_task_finished)
+        self._current = task
+        self._tasks[task.job_id] = task
+
+        self.pool.start(task)
+        self.started.emit(task.job_id)
+        return task.job_id
+
+    def cancel(self):
+        """取消当前任务"""
+        task = self._current
+        if task is None:
+            return
+
+        task.cancel()
+        # 尚未开始执行的任务直接从队列中移除
+        if self.pool.tryTake(task):
+            self._tasks.pop(task.job_id, None)
+        self._current = None
+        self.cancelled.emit(task.job_id)
+
+    def isBusy(self):
+        return self._current is not None
+
+    def currentJobId(self):
+        return self._current.job_id if self._current else None
+
+    def _on_task_finished(self, job_id, result, image_data):
+        """在主线程中接收任务结果，过滤掉已被取代的任务"""
+        self._tasks.pop(job_id, None)
+
+        task = self._current
+        if task is None or task.job_id != job_id or task.isCancelled():
+            return
+
+        self._current = None
+        self.finished.emit(job_id, result, image_data)
+
+    def shutdown(self, msecs=3000):
+        """取消任务并等待线程池退出"""
+        self.cancel()
+        self.pool.clear()
+        return self.pool.waitForDone(msecs)
@@ -0,0 +1,145 @@
+import threading
+
+import cv2
+import numpy as np
+
+from ..common.db_manager import decode_image_data
+from ..common.imaging import decode_image
+
+
+def dhash(image_data, hash_size=8):
+    """计算图像的差值哈希（dHash），返回 64 位整数
+
+    先缩放到 (hash_size+1) x hash_size 的灰度图，再比较相邻像素的明暗，
+    对轻微的缩放、边框和压缩噪声不敏感。
+    """
+    img = np.asarray(image_data)
+    if img.ndim == 3:
+        code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        img = cv2.cvtColor(img, code)
+    small = cv2.resize(img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    """两个哈希之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+def hash_to_hex(value):
+    return f"{value:016x}"
+
+
+def hash_from_hex(text):
+    return int(text, 16)
+
+
+class BKTree:
+    """ 基于汉明距离的 BK 树，支持按距离阈值快速查找 """
+
+    def __init__(self):
+        self.root = None  # 节点结构: [hash, [items], {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """返回所有距离不超过 max_distance 的 (distance, item)，按距离排序"""
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance:
+                results.extend((d, item) for item in node[1])
+            # 三角不等式剪枝
+            low, high = d - max_distance, d + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+
+        results.sort(key=lambda x: x[0])
+        return results
+
+    def __len__(self):
+        return self.size
+
+
+class PerceptualIndex:
+    """ 历史记录图片的感知哈希索引
+
+    哈希值保存在历史记录表的 phash 列中，启动时为缺少哈希的旧记录补算。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """从数据库构建索引"""
+        tree = BKTree()
+        missing = []
+        for record_id, phash, image_data in self.db.get_phash_records():
+            if phash:
+                tree.add(hash_from_hex(phash), record_id)
+            else:
+                missing.append((record_id, image_data))
+
+        # 为旧记录补算哈希
+        updates = []
+        for record_id, image_data in missing:
+            try:
+                img = decode_image(decode_image_data(image_data), cv2.IMREAD_GRAYSCALE)
+                if img is None:
+                    continue
+                value = dhash(img)
+                tree.add(value, record_id)
+                updates.append((hash_to_hex(value), record_id))
+            except Exception as e:
+                print(f"计算历史记录 {record_id} 的感知哈希失败: {e}")
+        if updates:
+            self.db.update_phashes(updates)
+
+        with self._lock:
+            self.tree = tree
+
+    def add(self, value, record_id):
+        with self._lock:
+            self.tree.add(value, record_id)
+
+    def find(self, value, max_distance):
+        """查找最相似且仍然存在的历史记录
+
+        Returns:
+            tuple: (distance, record) 或 None，record 为数据库中的记录
+        """
+        with self._lock:
+            matches = self.tree.search(value, max_distance)
+
+        for distance, record_id in matches:
+            record = self.db.get_record(record_id)
+            if record:  # 记录可能已被删除
+                return distance, record
+        return None
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+# 检查结果级别
+OK = 'ok'
+WARN = 'warn'
+REJECT = 'reject'
+
+
+def _sample(image_data, max_samples):
+    """按步长取样得到单通道小图（只是视图，不复制）"""
+    h, w = image_data.shape[:2]
+    step = max(1, int(np.ceil(np.sqrt(h * w / max_samples))))
+    sample = image_data[::step, ::step]
+    if sample.ndim == 3:
+        # 绿色通道近似亮度，省去颜色转换
+        sample = sample[..., 1]
+    return sample, step
+
+
+def check_image(image_data, min_side=8, tolerance=32,
+                min_ink_pixels=16, max_ink_ratio=0.5, min_glyph=6, max_samples=40000):
+    """
+    上传前的快速检查，拦截空白、纯色、过小的图片
+
+    通常只在取样后的小图上计算，任何尺寸的图片都能在 1 ms 内完成。空白判断使用墨迹像素的
+    绝对数量而不是占整张图的比例，大截图中的一个短公式不会被误判为空白；取样得到的墨迹
+    太少时（细笔画可能落在取样点之间）再按原分辨率确认一次。
+    Args:
+        image_data: OpenCV 格式的图像
+        min_side: 图片最短边的最小值
+        tolerance: 与背景亮度相差超过该值的像素视为墨迹
+        min_ink_pixels: 墨迹像素数（原图像素）小于该值视为空白
+        max_ink_ratio: 墨迹像素比例大于该值时可能不是公式（例如照片），只给出警告
+        min_glyph: 墨迹包围盒的最小边长（原图像素）
+        max_samples: 最多取样的像素数
+    Returns:
+        tuple: (级别, 提示信息, 统计信息)，级别为 OK / WARN / REJECT
+    """
+    h, w = image_data.shape[:2]
+    stats = {'width': w, 'height': h}
+    if min(h, w) < min_side:
+        return REJECT, '选区太小，请重新选择', stats
+
+    sample, step = _sample(image_data, max_samples)
+
+    # 出现次数最多的亮度作为背景
+    background = int(np.bincount(sample.ravel(), minlength=256).argmax())
+    ink = np.abs(sample.astype(np.int16) - background) > tolerance
+    ink_ratio = float(np.count_nonzero(ink)) / ink.size
+    ink_pixels = ink_ratio * h * w
+    if ink_pixels < min_ink_pixels and step > 1:
+        full = image_data[..., 1] if image_data.ndim == 3 else image_data
+        ink = np.abs(full.astype(np.int16) - background) > tolerance
+        step = 1
+        ink_pixels = np.count_nonzero(ink)
+        ink_ratio = float(ink_pixels) / ink.size
+    stats['ink_ratio'] = ink_ratio
+    stats['ink_pixels'] = int(ink_pixels)
+    # 不按整张图的标准差判断纯色：大截图中的小公式标准差也很低
+    if ink_pixels == 0:
+        return REJECT, '图片是纯色的，没有可识别的内容', stats
+    if ink_pixels < min_ink_pixels:
+        return REJECT, '图片几乎是空白的，没有可识别的内容', stats
+
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    glyph_h = (rows[-1] - rows[0] + 1) * step
+    glyph_w = (cols[-1] - cols[0] + 1) * step
+    stats['ink_bbox'] = (int(cols[0] * step), int(rows[0] * step), int(glyph_w), int(glyph_h))
+    if max(glyph_h, glyph_w) < min_glyph:
+        return REJECT, '图片中的内容太小，请放大后重试', stats
+
+    if ink_ratio > max_ink_ratio:
+        return WARN, '图片中缺少清晰的背景，识别结果可能不准确', stats
+    return OK, None, stats
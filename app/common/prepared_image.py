@@ -0,0 +1,95 @@
+import threading
+
+import cv2
+import numpy as np
+
+from ..common.ocr_cache import image_key
+
+
+def readonly_view(array):
+    """返回数组的只读视图（不复制数据）"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class PreparedImage:
+    """ 一次准备、多处共享的识别图像
+
+    保存原始像素、内容哈希和编码后的字节。上传和缓存使用同一份数据，不再重复编码或复制。
+    编码在第一次访问 data 时才进行，缓存命中时无需编码。历史记录保存的是未经预处理的原图
+    （source_data），与上传数据分开编码。创建后不可修改。
+    """
+
+    __slots__ = ('pixels', 'key', 'width', 'height', '_encode', '_encoded', '_source', '_lock')
+
+    def __init__(self, pixels, encode, key=None):
+        """
+        Args:
+            pixels: OpenCV 格式的原始图像
+            encode: 编码函数，接收原始图像，返回 (字节, 格式, MIME 类型, 统计信息)
+            key: 内容哈希，不传则根据像素计算
+        """
+        pixels = readonly_view(np.asarray(pixels))
+        set_ = object.__setattr__
+        set_(self, 'pixels', pixels)
+        set_(self, 'key', key or image_key(pixels))
+        set_(self, 'height', pixels.shape[0])
+        set_(self, 'width', pixels.shape[1])
+        set_(self, '_encode', encode)
+        set_(self, '_encoded', None)
+        set_(self, '_source', None)
+        set_(self, '_lock', threading.Lock())
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PreparedImage is immutable')
+
+    def _encoded_result(self):
+        if self._encoded is None:
+            with self._lock:
+                if self._encoded is None:
+                    data, fmt, mime, stats = self._encode(self.pixels)
+                    object.__setattr__(self, '_encoded', (memoryview(data).toreadonly(), fmt, mime, stats))
+        return self._encoded
+
+    @property
+    def source_data(self):
+        """原图的 PNG 编码（只读 memoryview），用于历史记录的缩略图和重新识别"""
+        if self._source is None:
+            with self._lock:
+                if self._source is None:
+                    ok, buffer = cv2.imencode('.png', self.pixels)
+                    if not ok:
+                        raise ValueError('原图编码失败')
+                    object.__setattr__(self, '_source', memoryview(buffer).cast('B').toreadonly())
+        return self._source
+
+    @property
+    def is_encoded(self):
+        return self._encoded is not None
+
+    @property
+    def data(self):
+        """编码后的只读字节（memoryview）"""
+        return self._encoded_result()[0]
+
+    @property
+    def format(self):
+        return self._encoded_result()[1]
+
+    @property
+    def mime(self):
+        return self._encoded_result()[2]
+
+    @property
+    def stats(self):
+        """预处理和编码的统计信息"""
+        return self._encoded_result()[3]
+
+    @property
+    def filename(self):
+        return f'formula.{self.format}'
+
+    @property
+    def size(self):
+        return self.width, self.height
@@ -0,0 +1,291 @@
+import time
+
+import cv2
+import numpy as np
+
+from ..common.config import cfg
+
+
+def to_gray(image_data):
+    """转换为单通道灰度图（已是灰度图时原样返回）"""
+    if image_data.ndim == 2:
+        return image_data
+    code = cv2.COLOR_BGRA2GRAY if image_data.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(image_data, code)
+
+
+def ink_mask(gray):
+    """Otsu 二值化得到前景（字符）掩码，自动适应深色背景"""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    # 前景占多数说明是深色背景，反转
+    if np.count_nonzero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def estimate_glyph_height(mask):
+    """
+    估计字符高度：连通域高度的中位数
+
+    忽略面积很小的噪点，以及等号、减号、分数线这类扁平的横线，
+    否则它们会把中位数拉低到几个像素。
+    """
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    stats = stats[1:count]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    keep = (stats[:, cv2.CC_STAT_AREA] > 4) & (heights * 3 >= stats[:, cv2.CC_STAT_WIDTH])
+    heights = heights[keep]
+    return float(np.median(heights)) if heights.size else 0.0
+
+
+class PreprocessStep:
+    """ 预处理步骤基类，子类实现 process """
+
+    name = 'step'
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+
+    def process(self, image_data):
+        raise NotImplementedError
+
+    def __call__(self, image_data):
+        return self.process(image_data)
+
+
+class AutoCropStep(PreprocessStep):
+    """ 裁掉四周颜色均匀的空白边距 """
+
+    name = 'crop'
+
+    def __init__(self, enabled=True, tolerance=24, padding=8):
+        super().__init__(enabled)
+        self.tolerance = tolerance
+        self.padding = padding
+
+    def process(self, image_data):
+        gray = to_gray(image_data)
+        h, w = gray.shape
+
+        # 以边框像素的中位数作为背景色
+        border = np.concatenate((gray[0], gray[-1], gray[:, 0], gray[:, -1]))
+        background = int(np.median(border))
+        mask = np.abs(gray.astype(np.int16) - background) > self.tolerance
+
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size == 0:
+            return image_data
+        cols = np.flatnonzero(mask.any(axis=0))
+
+        top = max(0, rows[0] - self.padding)
+        bottom = min(h, rows[-1] + 1 + self.padding)
+        left = max(0, cols[0] - self.padding)
+        right = min(w, cols[-1] + 1 + self.padding)
+        return image_data[top:bottom, left:right]
+
+
+class InvertStep(PreprocessStep):
+    """ 深色背景（深色主题截图、彩色幻灯片）时反色，统一为浅色背景深色文字 """
+
+    name = 'invert'
+
+    def __init__(self, enabled=True, threshold=128):
+        super().__init__(enabled)
+        self.threshold = threshold
+
+    @staticmethod
+    def background_level(gray):
+        """以边框像素的中位数作为背景亮度"""
+        border = np.concatenate((gray[0], gray[-1], gray[:, 0], gray[:, -1]))
+        return float(np.median(border))
+
+    def process(self, image_data):
+        if self.background_level(to_gray(image_data)) >= self.threshold:
+            return image_data
+        return cv2.bitwise_not(image_data)
+
+
+class GrayscaleStep(PreprocessStep):
+    """ 转换为灰度图，上传数据量约为彩色的三分之一 """
+
+    name = 'grayscale'
+
+    def process(self, image_data):
+        return to_gray(image_data)
+
+
+class ContrastStep(PreprocessStep):
+    """ CLAHE 局部对比度均衡，改善低对比度和背景不均匀的图片（彩色图只处理亮度通道） """
+
+    name = 'contrast'
+
+    def __init__(self, enabled=True, clip_limit=2.0, tile_size=8):
+        super().__init__(enabled)
+        self.clip_limit = clip_limit
+        self.tile_size = tile_size
+
+    def process(self, image_data):
+        # CLAHE 对象不是线程安全的，每次调用单独创建（开销很小）
+        clahe = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=(self.tile_size, self.tile_size))
+        if image_data.ndim == 2:
+            return clahe.apply(image_data)
+        lab = cv2.cvtColor(image_data[..., :3], cv2.COLOR_BGR2LAB)
+        lab[..., 0] = clahe.apply(np.ascontiguousarray(lab[..., 0]))
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+
+class DeskewStep(PreprocessStep):
+    """ 估计并校正小角度倾斜（例如手机拍摄的照片）
+
+    在缩小的二值图上对候选角度同时计算水平投影，投影最集中（平方和最大）的角度即为倾斜角。
+    """
+
+    name = 'deskew'
+
+    def __init__(self, enabled=True, max_angle=5.0, angle_step=0.25, min_angle=0.3,
+                 sample_size=400, max_points=20000):
+        super().__init__(enabled)
+        self.max_angle = max_angle
+        self.angle_step = angle_step
+        self.min_angle = min_angle      # 小于该角度时不旋转，避免无谓的插值模糊
+        self.sample_size = sample_size  # 估计角度时缩小到的最长边
+        self.max_points = max_points    # 参与投影的最大前景像素数
+
+    def estimate_angle(self, image_data):
+        """
+        估计倾斜角度
+        Returns:
+            float: 角度（度），正值表示文字行向右下倾斜
+        """
+        gray = to_gray(image_data)
+        h, w = gray.shape
+        scale = min(1.0, self.sample_size / max(h, w))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        ys, xs = np.nonzero(ink_mask(gray))
+        if ys.size < 50:
+            return 0.0
+        if ys.size > self.max_points:
+            index = np.linspace(0, ys.size - 1, self.max_points).astype(np.intp)
+            ys, xs = ys[index], xs[index]
+
+        # 所有候选角度一次性计算：旋转后的纵坐标 -> 每个角度的行直方图
+        angles = np.arange(-self.max_angle, self.max_angle + self.angle_step / 2, self.angle_step)
+        radians = np.deg2rad(angles)[:, None]
+        projected = ys[None, :] * np.cos(radians) - xs[None, :] * np.sin(radians)
+        bins = np.rint(projected - projected.min(axis=1, keepdims=True)).astype(np.intp)
+        bin_count = int(bins.max()) + 1
+        bins += np.arange(len(angles))[:, None] * bin_count
+        histograms = np.bincount(bins.ravel(), minlength=len(angles) * bin_count)
+        histograms = histograms.reshape(len(angles), bin_count).astype(np.float64)
+        scores = (histograms ** 2).sum(axis=1)
+        return float(angles[int(np.argmax(scores))])
+
+    def process(self, image_data):
+        angle = self.estimate_angle(image_data)
+        if abs(angle) < self.min_angle:
+            return image_data
+
+        h, w = image_data.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(image_data, matrix, (w, h), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+
+class DownscaleStep(PreprocessStep):
+    """ 将最长边缩小到 max_dimension 以内，但保证字符高度不低于 min_glyph_height """
+
+    name = 'downscale'
+
+    def __init__(self, enabled=True, max_dimension=1600, min_glyph_height=24):
+        super().__init__(enabled)
+        self.max_dimension = max_dimension
+        self.min_glyph_height = min_glyph_height
+
+    def process(self, image_data):
+        h, w = image_data.shape[:2]
+        longest = max(h, w)
+        if self.max_dimension <= 0 or longest <= self.max_dimension:
+            return image_data
+
+        scale = self.max_dimension / longest
+        glyph_height = estimate_glyph_height(ink_mask(to_gray(image_data)))
+        if glyph_height > 0:
+            scale = max(scale, self.min_glyph_height / glyph_height)
+        if scale >= 1:
+            return image_data
+
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(image_data, size, interpolation=cv2.INTER_AREA)
+
+
+class BinarizeStep(PreprocessStep):
+    """ Otsu 二值化，得到黑白两色图像 """
+
+    name = 'binarize'
+
+    def process(self, image_data):
+        _, binary = cv2.threshold(to_gray(image_data), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        return binary
+
+
+class PreprocessPipeline:
+    """ 上传前的图像预处理流水线
+
+    每个步骤都可以单独开关，并记录耗时，便于评估效果。
+    """
+
+    def __init__(self, steps=None, enabled=True):
+        self.steps = list(steps or [])
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls):
+        """根据配置创建流水线"""
+        return cls([
+            AutoCropStep(cfg.preprocessAutoCrop.value),
+            InvertStep(cfg.preprocessInvert.value),
+            GrayscaleStep(cfg.preprocessGrayscale.value),
+            ContrastStep(cfg.preprocessContrast.value),
+            DeskewStep(cfg.preprocessDeskew.value, max_angle=cfg.preprocessMaxSkew.value),
+            DownscaleStep(
+                cfg.preprocessDownscale.value,
+                max_dimension=cfg.preprocessMaxDimension.value,
+                min_glyph_height=cfg.preprocessMinGlyphHeight.value
+            ),
+            BinarizeStep(cfg.preprocessBinarize.value),
+        ], enabled=cfg.preprocessEnabled.value)
+
+    def add_step(self, step, index=None):
+        """添加自定义步骤"""
+        if index is None:
+            self.steps.append(step)
+        else:
+            self.steps.insert(index, step)
+
+    def step(self, name):
+        for s in self.steps:
+            if s.name == name:
+                return s
+        return None
+
+    def run(self, image_data):
+        """
+        依次执行已启用的步骤
+        Returns:
+            tuple: (处理后的图像, 统计信息)，统计信息包含每个步骤的耗时（毫秒）和图像尺寸
+        """
+        stats = {'input_shape': image_data.shape, 'timings': {}}
+        if self.enabled:
+            for step in self.steps:
+                if not step.enabled:
+                    continue
+                start = time.perf_counter()
+                try:
+                    image_data = step(image_data)
+                except Exception as e:
+                    print(f"预处理步骤 {step.name} 出错: {e}")
+                stats['timings'][step.name] = (time.perf_counter() - start) * 1000
+        stats['output_shape'] = image_data.shape
+        return np.ascontiguousarray(image_data), stats
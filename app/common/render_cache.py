@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from ..common.config import cfg
+
+
+def normalize_latex(latex):
+    """
+    规范化 LaTeX 源码，只影响缓存键，不影响实际渲染的内容
+
+    去掉首尾空白，并将连续空白合并为一个空格（含 % 注释时不合并，因为换行决定了注释的结束位置）。
+    $$ / \\[ \\] 等定界符会原样交给 MathJax 渲染，结果与不带定界符时不同，因此保留在键中。
+    """
+    latex = (latex or '').strip()
+    if '%' not in latex:
+        latex = re.sub(r'\s+', ' ', latex)
+    return latex
+
+
+class RenderCache:
+    """ 公式渲染结果的两级缓存
+
+    以规范化的 LaTeX 和渲染参数为键，保存 SVG 和指定缩放比例的 PNG。
+    内存中是按字节数限制大小的 LRU，磁盘上每个条目一个文件，超出容量时按最近访问时间淘汰。
+    """
+
+    EXTENSIONS = {'svg': 'svg', 'png': 'png'}
+
+    def __init__(self, cache_dir='app/data/render_cache', max_memory_bytes=32 * 1024 * 1024,
+                 max_disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk_bytes = None        # 首次写入时再统计
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(latex, kind, **options):
+        """缓存键：规范化的源码 + 类型 + 渲染参数"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(normalize_latex(latex).encode('utf-8'))
+        h.update(b'\0')
+        h.update(json.dumps([kind, options], sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key, kind):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{self.EXTENSIONS[kind]}")
+
+    def get(self, latex, kind, **options):
+        """
+        查询缓存，先查内存再查磁盘
+        Args:
+            latex: LaTeX 源码
+            kind: 'svg' 或 'png'
+            options: 渲染参数，例如 scale、padding
+        Returns:
+            bytes: 命中时返回数据，否则返回 None
+        """
+        key = self.key(latex, kind, **options)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        path = self._path(key, kind)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 更新访问时间，磁盘淘汰按访问时间进行
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def disk_path(self, latex, kind, **options):
+        """磁盘缓存文件的路径（不存在时返回 None），可以直接在富文本中引用"""
+        path = self._path(self.key(latex, kind, **options), kind)
+        return path if os.path.exists(path) else None
+
+    def put(self, latex, kind, data, **options):
+        """写入缓存（同时写入内存和磁盘）"""
+        data = bytes(data)
+        key = self.key(latex, kind, **options)
+        with self._lock:
+            self._remember(key, data)
+
+        path = self._path(key, kind)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"写入渲染缓存失败: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data) - previous
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self.evict_disk()
+
+    def _remember(self, key, data):
+        """写入内存 LRU（调用方持有锁）"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(data) > self.max_memory_bytes:
+            return
+        self._entries[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_files(self):
+        """磁盘上的所有缓存文件 [(访问时间, 大小, 路径)]"""
+        files = []
+        if not os.path.isdir(self.cache_dir):
+            return files
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _scan_disk_bytes(self):
+        return sum(size for _, size, _ in self._disk_files())
+
+    def evict_disk(self, target_ratio=0.9):
+        """淘汰最久未访问的磁盘条目，直到占用降到上限的 target_ratio"""
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * target_ratio
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"删除渲染缓存失败: {e}")
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+            self.memory_hits = self.disk_hits = self.misses = 0
+        for _, _, path in self._disk_files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = 0
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                'memory_entries': len(self._entries),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0
+            }
+
+
+renderCache = RenderCache(
+    max_memory_bytes=cfg.renderCacheMemoryMB.value * 1024 * 1024,
+    max_disk_bytes=cfg.renderCacheDiskMB.value * 1024 * 1024
+)
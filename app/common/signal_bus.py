@@ -1,5 +1,6 @@
 # coding: utf-8
 from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
 
 
 class SignalBus(QObject):
@@ -9,7 +10,11 @@ class SignalBus(QObject):
     micaEnableChanged = pyqtSignal(bool)
     supportSignal = pyqtSignal()
     screenshotHotkeyChanged = pyqtSignal(str)  # 快捷键更新信号
-    screenshotTaken = pyqtSignal(str)  # 截图完成信号，参数为图片路径
+    screenshotTaken = pyqtSignal(QImage)  # 截图完成信号，参数为截取的图像
+    screenshotSpeculate = pyqtSignal(QImage)  # 拖拽停顿时的当前选区，可提前识别
+    regionWatchCaptured = pyqtSignal(QImage)  # 监视区域内容变化后的图像
+    regionWatchStateChanged = pyqtSignal(bool)  # 区域监视开始/停止
+    regionWatchPausedChanged = pyqtSignal(bool)  # 监视区域被主窗口遮挡而暂停/恢复
 
 
 signalBus = SignalBus()
\ No newline at end of file
@@ -0,0 +1,277 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from ..common.layout import detect_formula_regions, formula_density
+from ..common.phash_index import BKTree, dhash, hash_to_hex, hash_from_hex
+
+
+class SceneDetector:
+    """ 基于灰度直方图和像素差的场景变化检测 """
+
+    def __init__(self, width=160, hist_threshold=0.15, pixel_threshold=24, change_ratio=0.01):
+        self.width = width
+        self.hist_threshold = hist_threshold
+        self.pixel_threshold = pixel_threshold
+        self.change_ratio = change_ratio
+
+    def signature(self, frame):
+        """缩小后的灰度图和归一化直方图"""
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.width / max(1, w))
+        small = cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        hist = cv2.calcHist([gray], [0], None, [64], [0, 256])
+        cv2.normalize(hist, hist)
+        return gray, hist
+
+    def changed(self, a, b):
+        if a is None or b is None:
+            return True
+        gray_a, hist_a = a
+        gray_b, hist_b = b
+        # 直方图变化大时一定是换了画面；否则再看像素差，捕捉同一背景下的内容变化
+        if cv2.compareHist(hist_a, hist_b, cv2.HISTCMP_BHATTACHARYYA) > self.hist_threshold:
+            return True
+        diff = cv2.absdiff(gray_a, gray_b)
+        return np.count_nonzero(diff > self.pixel_threshold) > self.change_ratio * diff.size
+
+
+class VideoIngestor:
+    """ 从录播视频中提取并识别不重复的公式
+
+    整个流程是流式的生成器：读帧 → 场景检测 → 公式区域检测 → 感知哈希去重 → 批量识别，
+    同一时间只有少量帧在内存中。处理进度保存在状态文件中，中断后可以继续。
+    """
+
+    def __init__(self, service, db=None, min_interval=0.5, max_interval=4.0,
+                 dedupe_distance=6, max_concurrency=4, state_path=None, min_formula_density=0.1):
+        """
+        Args:
+            service: 识别服务
+            db: DatabaseManager，传入时识别结果会保存到历史记录
+            min_interval: 最小采样间隔（秒），画面变化时使用
+            max_interval: 最大采样间隔（秒），画面长时间不变时逐渐放大到该值
+            dedupe_distance: 感知哈希距离不超过该值时视为重复公式
+            max_concurrency: 批量识别的最大并发数
+            state_path: 状态文件路径，默认为视频路径加 .ingest.json
+            min_formula_density: 公式特征字符的最小比例，低于该值的区域视为普通文字不识别，0 表示不过滤
+        """
+        self.service = service
+        self.db = db
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.dedupe_distance = dedupe_distance
+        self.max_concurrency = max_concurrency
+        self.state_path = state_path
+        self.min_formula_density = min_formula_density
+        self.detector = SceneDetector()
+
+    # ---------- 状态 ----------
+
+    def _state_file(self, path):
+        return self.state_path or f"{path}.ingest.json"
+
+    def load_state(self, path):
+        """读取上次中断时的进度"""
+        state_file = self._state_file(path)
+        if not os.path.exists(state_file):
+            return {'next_frame': 0, 'hashes': [], 'found': 0}
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取视频处理进度失败: {e}")
+            return {'next_frame': 0, 'hashes': [], 'found': 0}
+
+    def save_state(self, path, state):
+        state_file = self._state_file(path)
+        tmp = state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, state_file)
+
+    def clear_state(self, path):
+        state_file = self._state_file(path)
+        if os.path.exists(state_file):
+            os.remove(state_file)
+
+    # ---------- 读帧 ----------
+
+    def iter_key_frames(self, cap, fps, start_frame=0):
+        """
+        自适应采样并返回画面稳定后的关键帧
+        Yields:
+            tuple: (帧序号, 帧图像)
+        """
+        min_step = max(1, int(round(self.min_interval * fps)))
+        max_step = max(min_step, int(round(self.max_interval * fps)))
+        step = min_step
+
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        position = start_frame
+        previous = None
+        pending_change = True  # 画面变化后等待稳定
+
+        while True:
+            # 跳过的帧只 grab 不解码
+            for _ in range(step - 1):
+                if not cap.grab():
+                    return
+                position += 1
+            ok, frame = cap.read()
+            if not ok:
+                return
+            index = position
+            position += 1
+
+            signature = self.detector.signature(frame)
+            if self.detector.changed(previous, signature):
+                # 画面在变化，缩短采样间隔，等下一帧稳定后再取
+                pending_change = True
+                step = min_step
+            else:
+                if pending_change:
+                    pending_change = False
+                    yield index, frame
+                # 画面长时间不变时逐渐放大采样间隔
+                step = min(max_step, step * 2)
+            previous = signature
+
+    # ---------- 主流程 ----------
+
+    def run(self, path, progress=None, resume=True):
+        """
+        处理视频
+        Args:
+            path: 视频文件路径
+            progress: 进度回调，参数为 dict(frame, total, found)
+            resume: 是否从上次中断的位置继续
+        Yields:
+            dict: {'frame', 'time', 'bbox', 'result', 'image', 'record_id'}，image 为 PreparedImage
+        """
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError(f'无法打开视频: {path}')
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        state = self.load_state(path) if resume else {'next_frame': 0, 'hashes': [], 'found': 0}
+        seen = BKTree()
+        for value in state['hashes']:
+            seen.add(hash_from_hex(value), None)
+
+        pending = {}            # 批量识别序号 -> (帧序号, 区域, PreparedImage, 感知哈希)
+        counter = itertools.count()
+        read_position = [state['next_frame']]
+
+        def crops():
+            for frame_index, frame in self.iter_key_frames(cap, fps, state['next_frame']):
+                read_position[0] = frame_index + 1
+                if progress:
+                    progress({'frame': frame_index, 'total': total, 'found': state['found']})
+
+                # 一帧中的多个公式分别去重和识别
+                for x, y, w, h in detect_formula_regions(frame, padding=12):
+                    crop = frame[y:y + h, x:x + w]
+                    value = dhash(crop)
+                    if seen.search(value, self.dedupe_distance):
+                        continue
+                    seen.add(value, None)
+                    # 幻灯片上的普通文字行不识别（加入去重表后，之后的帧不再重复判断）
+                    if self.min_formula_density and formula_density(crop) < self.min_formula_density:
+                        continue
+
+                    image = self.service.prepare(crop)
+                    pending[next(counter)] = (frame_index, (x, y, w, h), image, value)
+                    yield image
+
+        try:
+            for batch_index, result in self.service.recognize_batch(crops(), self.max_concurrency):
+                frame_index, bbox, image, value = pending.pop(batch_index)
+
+                record_id = None
+                if result['status']:
+                    state['found'] += 1
+                    state['hashes'].append(hash_to_hex(value))
+                    if self.db:
+                        record_id = self.db.add_record(
+                            image.source_data, result['latex'], result['confidence'],
+                            result['request_id'], hash_to_hex(value), image.key
+                        )
+
+                # 从尚未完成的最早一帧继续，保证中断后不会漏掉
+                unfinished = [f for f, _, _, _ in pending.values()]
+                state['next_frame'] = min(unfinished) if unfinished else read_position[0]
+                self.save_state(path, state)
+
+                yield {
+                    'frame': frame_index,
+                    'time': frame_index / fps,
+                    'bbox': bbox,
+                    'result': result,
+                    'image': image,
+                    'record_id': record_id
+                }
+
+            state['next_frame'] = read_position[0]
+            self.save_state(path, state)
+            if progress:
+                progress({'frame': total, 'total': total, 'found': state['found']})
+        finally:
+            cap.release()
+
+
+def main(argv=None):
+    """
+    命令行处理录播视频，识别结果保存到历史记录
+
+    运行方式:
+        python -m app.common.video_ingest lecture.mp4
+        python -m app.common.video_ingest lecture.mp4 --restart --concurrency 2
+    """
+    parser = argparse.ArgumentParser(description='提取并识别录播视频中的公式')
+    parser.add_argument('video', help='视频文件路径')
+    parser.add_argument('--restart', action='store_true', help='忽略上次的进度，从头开始')
+    parser.add_argument('--no-save', action='store_true', help='不保存到历史记录')
+    parser.add_argument('--concurrency', type=int, default=4, help='最大并发识别数')
+    parser.add_argument('--min-density', type=float, default=0.1,
+                        help='公式特征字符的最小比例，0 表示识别所有区域')
+    args = parser.parse_args(argv)
+
+    from ..common.db_manager import DatabaseManager
+    from ..common.ocr_service import OcrServiceFactory
+
+    ingestor = VideoIngestor(
+        OcrServiceFactory.create_service(),
+        db=None if args.no_save else DatabaseManager(),
+        max_concurrency=args.concurrency,
+        min_formula_density=args.min_density
+    )
+
+    def progress(info):
+        if info['total']:
+            print(f"\r进度 {info['frame']} / {info['total']}，已识别 {info['found']} 个公式", end='', flush=True)
+
+    failed = 0
+    for item in ingestor.run(args.video, progress=progress, resume=not args.restart):
+        result = item['result']
+        if result['status']:
+            print(f"\n[{item['time']:.1f}s] {result['latex']}")
+        else:
+            failed += 1
+            print(f"\n[{item['time']:.1f}s] 识别失败: {result['message']}")
+    print(f"\n完成，失败 {failed} 个")
+    return 0 if not failed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,154 +1,199 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QSizePolicy
 from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import Qt, QUrl, QTimer
+from PyQt5.QtWebChannel import QWebChannel
+from PyQt5.QtCore import Qt, QUrl, QTimer, QObject, QRect, pyqtSignal, pyqtSlot
+from collections import deque
+import json
 import os
+import time
+
+from ..common import mathjax
+from ..common.config import cfg
+from ..common.imaging import content_bbox, pixmap_from_bytes, pixmap_to_bytes
+from ..common.render_cache import renderCache
+
+
+class RenderBridge(QObject):
+    """ 页面与 Python 之间的 QWebChannel 桥接对象 """
+
+    typeset = pyqtSignal(dict)  # 页面排版完成后上报的信息
+
+    @pyqtSlot(str)
+    def typesetFinished(self, payload):
+        try:
+            self.typeset.emit(json.loads(payload))
+        except ValueError as e:
+            print(f"解析渲染结果失败: {e}")
+
 
 class LaTeXRenderer(QWebEngineView):
+    """ LaTeX 公式渲染视图
+
+    页面常驻并只加载一次 MathJax，排版完成后由页面通过 QWebChannel 主动上报公式的尺寸，
+    据此调整高度并通知等待渲染结果的操作（例如复制图片）。
+    """
+
+    # 影响排版结果的参数，作为渲染缓存键的一部分（与 renderer.html 中的 MathJax 配置一致）
+    RENDER_OPTIONS = {'display': True, 'scale': 1.2}
+
+    rendered = pyqtSignal(dict)  # 最新一次渲染完成：id, ok, bbox, svg, pageHeight, typesetMs, latencyMs
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setMinimumHeight(60)
+        # setFixedHeight 会改变最小高度，这里单独记录
+        self.baseHeight = 60
+        self.renderTimeout = 2000  # 页面没有上报时，等待渲染的回调最多等待的时间（毫秒）
+        self.setMinimumHeight(self.baseHeight)
         self.setSizePolicy(
             QSizePolicy.Expanding,
             QSizePolicy.MinimumExpanding
         )
-        
-        # 创建定时器用于检查内容高度
-        self.heightCheckTimer = QTimer(self)
-        self.heightCheckTimer.setInterval(100)  # 100ms 检查一次
-        self.heightCheckTimer.timeout.connect(self.checkContentHeight)
-        
-        self.template = """
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <script>
-                    window.MathJax = {
-                        tex: {
-                            inlineMath: [['$', '$'], ['\\\\(', '\\\\)']],
-                            displayMath: [['$$', '$$'], ['\\\\[', '\\\\]']]
-                        },
-                        svg: {
-                            fontCache: 'local',
-                            scale: 1.2,
-                            minScale: 0.5,
-                            mtextInheritFont: false,
-                            merrorInheritFont: true,
-                            mathmlSpacing: false,
-                            skipAttributes: {},
-                            exFactor: 0.5,
-                            displayAlign: 'center',
-                            displayIndent: '0'
-                        },
-                        startup: {
-                            typeset: false,
-                            ready: () => {
-                                MathJax.startup.defaultReady();
-                                MathJax.startup.promise.then(() => {
-                                    // 渲染完成后调整高度
-                                    setTimeout(() => {
-                                        var height = document.body.scrollHeight;
-                                        document.body.style.minHeight = height + 'px';
-                                    }, 100);
-                                });
-                            }
-                        }
-                    };
-                </script>
-                <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-svg.js"></script>
-                <style>
-                    body {
-                        margin: 0;
-                        padding: 10px;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        min-height: 60px;
-                        background: white;
-                        font-family: 'Times New Roman', serif;
-                    }
-                    .math {
-                        font-size: 18px;
-                        line-height: 1.2;
-                        text-align: center;
-                        width: 100%;
-                        opacity: 0;
-                        transition: opacity 0.3s ease-in-out;
-                    }
-                    .math.loaded {
-                        opacity: 1;
-                    }
-                    mjx-container {
-                        margin: 0 !important;
-                        padding: 0 !important;
-                    }
-                </style>
-            </head>
-            <body>
-                <div class="math" id="mathContainer">$$__LATEX__$$</div>
-                <script>
-                    // 立即开始渲染
-                    MathJax.typesetPromise().then(() => {
-                        document.getElementById('mathContainer').classList.add('loaded');
-                    }).catch((err) => {
-                        console.log('MathJax rendering error:', err);
-                        document.getElementById('mathContainer').classList.add('loaded');
-                    });
-                </script>
-            </body>
-            </html>
-        """
+
+        # 渲染延迟记录（毫秒）：从调用 render_latex 到页面上报排版完成
+        self.latencies = deque(maxlen=100)
+        self.lastRender = None
+        self._renderId = 0
+        self._renderStart = {}
+        self._renderLatex = {}
+        self._waiting = []  # 等待当前渲染完成的回调
+        # 页面异常（例如 MathJax 加载失败）时不至于一直等待；每次等待都重新计时，
+        # 之前的等待留下的超时不会提前触发之后的回调
+        self.waitTimer = QTimer(self)
+        self.waitTimer.setSingleShot(True)
+        self.waitTimer.timeout.connect(self._flushWaiting)
+
+        self.bridge = RenderBridge(self)
+        self.bridge.typeset.connect(self._onTypeset)
+        self.channel = QWebChannel(self.page())
+        self.channel.registerObject('bridge', self.bridge)
+        self.page().setWebChannel(self.channel)
+
+        # 常驻页面：MathJax 只加载一次，之后的公式通过 runJavaScript 原地替换
+        self._pageLoaded = False
+        self._pendingLatex = None
+        self.loadFinished.connect(self._onLoadFinished)
+        self.setHtml(mathjax.page_html(), mathjax.base_url())
+
+    def _onLoadFinished(self, ok):
+        self._pageLoaded = ok
+        if not ok:
+            print("公式渲染页面加载失败")
+            return
+        if self._pendingLatex is not None:
+            latex, self._pendingLatex = self._pendingLatex, None
+            self.render_latex(latex)
 
     def render_latex(self, latex_str):
         """渲染LaTeX公式"""
-        if not latex_str:
-            self.setHtml("")
-            self.heightCheckTimer.stop()
+        latex_str = latex_str or ''
+        self._renderId += 1
+        self._renderStart = {self._renderId: time.perf_counter()}
+        self._renderLatex = {self._renderId: latex_str}
+        if not self._pageLoaded:
+            # 页面尚未加载完成，加载完成后再渲染
+            self._pendingLatex = latex_str
             return
-            
-        # HTML模板
-        html = self.template.replace('__LATEX__', latex_str)
-        self.setHtml(html)
-        
-        # 启动高度检查定时器
-        self.heightCheckTimer.start()
-
-    def checkContentHeight(self):
-        """检查内容高度"""
-        # 执行 JavaScript 来获取内容高度
-        self.page().runJavaScript("""
-            document.body.scrollHeight;
-        """, self.updateHeight)
-
-    def updateHeight(self, height):
-        """更新高度"""
-        if height and height > self.minimumHeight():
-            # 添加一些边距
-            self.setFixedHeight(height + 32)
-            # 停止定时器
-            self.heightCheckTimer.stop()
-
-    def get_image(self):
-        """获取渲染后的图像，裁剪掉多余的空白"""
+
+        # 同一公式之前排版过时直接显示缓存的 SVG
+        markup = renderCache.get(latex_str, 'svg', **self.RENDER_OPTIONS) if latex_str.strip() else None
+        if markup is not None:
+            self.page().runJavaScript(
+                f"showMarkup({json.dumps(markup.decode('utf-8'))}, {self._renderId});")
+        else:
+            self.page().runJavaScript(f"renderLatex({json.dumps(latex_str)}, {self._renderId});")
+
+    def isRendering(self):
+        """是否有尚未完成的渲染"""
+        return bool(self._renderStart)
+
+    def whenRendered(self, callback):
+        """当前渲染完成后调用 callback（没有进行中的渲染时立即调用）"""
+        if self.isRendering():
+            self._waiting.append(callback)
+            self.waitTimer.start(self.renderTimeout)
+        else:
+            callback()
+
+    def _flushWaiting(self):
+        self.waitTimer.stop()
+        waiting, self._waiting = self._waiting, []
+        for callback in waiting:
+            callback()
+
+    def _onTypeset(self, info):
+        """页面上报排版完成，只处理最新一次渲染"""
+        start = self._renderStart.pop(info.get('id'), None)
+        latex = self._renderLatex.pop(info.get('id'), None)
+        if start is None:
+            return
+
+        markup = info.pop('markup', None)
+        if markup and latex:
+            renderCache.put(latex, 'svg', markup.encode('utf-8'), **self.RENDER_OPTIONS)
+
+        info['latencyMs'] = (time.perf_counter() - start) * 1000
+        self.latencies.append(info['latencyMs'])
+        self.lastRender = info
+
+        # 根据内容实际高度调整，内容变矮时也会收缩
+        height = info.get('pageHeight')
+        if height:
+            self.setFixedHeight(max(self.baseHeight, int(height) + 32))
+
+        self.rendered.emit(info)
+        self._flushWaiting()
+
+    def latency_stats(self):
+        """渲染延迟的统计（毫秒）"""
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return {
+            'count': len(values),
+            'last': self.latencies[-1],
+            'median': values[len(values) // 2],
+            'max': values[-1]
+        }
+
+    @classmethod
+    def image_options_for(cls, scale, padding=None):
+        """复制为图片时的渲染参数（缓存键的一部分）"""
+        if padding is None:
+            padding = cfg.renderCropPadding.value
+        return dict(cls.RENDER_OPTIONS, scale=scale, padding=padding)
+
+    def image_options(self, padding=None):
+        return self.image_options_for(self.devicePixelRatioF(), padding)
+
+    def cached_image(self, latex, padding=None):
+        """查询公式图片的缓存，未命中时返回 None"""
+        options = self.image_options(padding)
+        data = renderCache.get(latex, 'png', **options)
+        if data is None:
+            return None
+        pixmap = pixmap_from_bytes(data)
+        pixmap.setDevicePixelRatio(options['scale'])
+        return pixmap
+
+    def cache_image(self, latex, pixmap, padding=None):
+        """将截取的公式图片写入缓存"""
+        renderCache.put(latex, 'png', pixmap_to_bytes(pixmap), **self.image_options(padding))
+
+    def get_image(self, padding=None):
+        """获取渲染后的图像，四周裁剪掉多余的空白
+
+        Args:
+            padding: 四周保留的边距（逻辑像素），默认使用配置
+        """
         full = self.grab()
-        # 获取非空白区域
         image = full.toImage()
-        rect = image.rect()
-        for x in range(rect.left(), rect.right()):
-            for y in range(rect.top(), rect.bottom()):
-                if image.pixelColor(x, y).alpha() > 0:
-                    rect.setLeft(max(0, x - 5))  # 左边留5像素边距
-                    break
-            else:
-                continue
-            break
-        
-        for x in range(rect.right(), rect.left(), -1):
-            for y in range(rect.top(), rect.bottom()):
-                if image.pixelColor(x, y).alpha() > 0:
-                    rect.setRight(min(image.width(), x + 5))  # 右边留5像素边距
-                    break
-            else:
-                continue
-            break
-        
-        return full.copy(rect) 
\ No newline at end of file
+        bbox = content_bbox(image, tolerance=cfg.renderCropTolerance.value)
+        if bbox is None:
+            return full
+
+        if padding is None:
+            padding = cfg.renderCropPadding.value
+        pad = int(round(padding * full.devicePixelRatio()))
+        x, y, w, h = bbox
+        rect = QRect(x - pad, y - pad, w + 2 * pad, h + 2 * pad).intersected(image.rect())
+        return full.copy(rect)
@@ -0,0 +1,144 @@
+# coding: utf-8
+import time
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from ..common.imaging import qimage_to_bgr
+
+
+class FrameDiffer:
+    """ 基于缩小灰度图的帧差检测 """
+
+    def __init__(self, width=128, pixel_threshold=16, change_ratio=0.005):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.change_ratio = change_ratio
+
+    def thumbnail(self, image_data):
+        """缩小并转为灰度，后续比较只在小图上进行"""
+        h, w = image_data.shape[:2]
+        scale = min(1.0, self.width / max(1, w))
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small = cv2.resize(image_data, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def changed(self, a, b):
+        """两张缩略图之间是否有明显变化"""
+        if a is None or b is None or a.shape != b.shape:
+            return True
+        diff = cv2.absdiff(a, b)
+        return np.count_nonzero(diff > self.pixel_threshold) > self.change_ratio * diff.size
+
+
+class RegionWatcher(QObject):
+    """ 固定区域监视
+
+    定时抓取固定的屏幕区域，内容发生变化并连续稳定若干帧后发出 regionChanged，
+    适合幻灯片、录播课等需要反复截取同一区域的场景。
+    区域被程序自身的窗口遮挡时暂停抓取，避免把自己的界面更新当成内容变化。
+    """
+
+    regionChanged = pyqtSignal(QImage)  # 变化后稳定下来的区域图像
+    stateChanged = pyqtSignal(bool)     # 是否正在监视
+    pausedChanged = pyqtSignal(bool)    # 是否因区域被遮挡而暂停
+
+    def __init__(self, parent=None, interval=500, stable_frames=3, change_ratio=0.005):
+        super().__init__(parent)
+        self.interval = interval
+        self.stable_frames = stable_frames
+        self.differ = FrameDiffer(change_ratio=change_ratio)
+        self.screen = None
+        self.rect = None
+        self.exclude = ()
+        self.paused = False
+        self.last_diff_ms = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self._reset()
+
+    def _reset(self):
+        self._previous = None   # 上一帧缩略图
+        self._submitted = None  # 上次提交识别的缩略图
+        self._stable = 0
+
+    def isWatching(self):
+        return self.timer.isActive()
+
+    def start(self, screen, rect, exclude=()):
+        """
+        开始监视
+        Args:
+            screen: 区域所在的 QScreen
+            rect: 相对于该屏幕的逻辑坐标区域
+            exclude: 程序自身的窗口，与区域重叠时暂停抓取
+        """
+        self.screen = screen
+        self.rect = rect
+        self.exclude = tuple(exclude)
+        self._setPaused(False)
+        self._reset()
+        self.timer.start(self.interval)
+        self.stateChanged.emit(True)
+
+    def stop(self):
+        if not self.timer.isActive():
+            return
+        self.timer.stop()
+        self.screen = None
+        self.exclude = ()
+        self._setPaused(False)
+        self._reset()
+        self.stateChanged.emit(False)
+
+    def _grab(self):
+        r = self.rect
+        return self.screen.grabWindow(0, r.x(), r.y(), r.width(), r.height()).toImage()
+
+    def isObscured(self):
+        """区域是否被程序自身的窗口遮挡"""
+        region = self.rect.translated(self.screen.geometry().topLeft())
+        return any(
+            window.isVisible() and not window.isMinimized() and window.frameGeometry().intersects(region)
+            for window in self.exclude
+        )
+
+    def _setPaused(self, paused):
+        if paused != self.paused:
+            self.paused = paused
+            self.pausedChanged.emit(paused)
+
+    def _tick(self):
+        obscured = self.isObscured()
+        self._setPaused(obscured)
+        if obscured:
+            # 移开后重新开始计算稳定帧，遮挡期间的画面不参与比较
+            self._previous = None
+            self._stable = 0
+            return
+
+        try:
+            image = self._grab()
+        except Exception as e:
+            print(f"区域监视抓取失败: {e}")
+            self.stop()
+            return
+
+        start = time.perf_counter()
+        current = self.differ.thumbnail(qimage_to_bgr(image))
+        if self.differ.changed(self._previous, current):
+            self._stable = 0
+        else:
+            self._stable += 1
+        self._previous = current
+
+        # 内容稳定且与上次识别的内容不同才提交
+        submit = self._stable + 1 >= self.stable_frames and self.differ.changed(self._submitted, current)
+        self.last_diff_ms = (time.perf_counter() - start) * 1000
+
+        if submit:
+            self._submitted = current
+            self.regionChanged.emit(image)
@@ -1,23 +1,80 @@
 # coding: utf-8
 import sys
 import os
+import math
 import tempfile
+import time
+from collections import deque
 from datetime import datetime
-from PyQt5.QtCore import Qt, QRect, pyqtSignal, QPoint, QTimer
+from PyQt5.QtCore import Qt, QRect, pyqtSignal, QPoint, QTimer, QObject, QRunnable, QThreadPool
 from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor, QCursor, QKeySequence
 from PyQt5.QtWidgets import QWidget, QApplication, QDesktopWidget, QRubberBand, QLabel
 
+from ..common.config import cfg
+from ..common.imaging import qimage_to_gray
+from ..common.layout import detect_text_blocks
+from .region_watcher import RegionWatcher
+
+
+class SnapDetectSignals(QObject):
+    """ 候选框检测信号 """
+
+    finished = pyqtSignal(int, object, float)  # 截图序号, 候选框 (N x 4, 物理像素), 耗时（毫秒）
+
+
+class SnapDetectTask(QRunnable):
+    """ 在后台线程中检测截图中的文本/公式块 """
+
+    def __init__(self, generation, image):
+        super().__init__()
+        self.generation = generation
+        self.image = image
+        self.signals = SnapDetectSignals()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            boxes = detect_text_blocks(qimage_to_gray(self.image))
+        except Exception as e:
+            print(f"候选框检测失败: {e}")
+            boxes = []
+        self.signals.finished.emit(self.generation, boxes, (time.perf_counter() - start) * 1000)
+
 
 class ScreenshotWidget(QWidget):
-    """截图选择窗口"""
+    """截图选择窗口
+
+    窗口只创建一次并在每次截图时复用，capture() 只负责抓取屏幕和重置选区。
+    """
     
     screenshotSelected = pyqtSignal(QPixmap)
+    speculate = pyqtSignal(QPixmap)  # 拖拽停顿时的当前选区
+    watchSelected = pyqtSignal(object, QRect)  # 按住 Shift 松开时：屏幕, 相对于屏幕的区域
+    cancelled = pyqtSignal()
+    shown = pyqtSignal(float)  # 从开始截图到窗口首次绘制的耗时（毫秒）
     
     def __init__(self):
         super().__init__()
-        self.initUI()
+        self.screen = QPixmap()
+        self.currentScreen = None
+        self.scale = 1.0  # 截图的物理像素 / 窗口逻辑像素
         self.rubberBand = None
         self.origin = QPoint()
+        self._capture_start = None
+        self._speculated_rect = QRect()
+
+        # 吸附选区：后台检测到的候选框（逻辑坐标）和当前悬停的候选框
+        self.snapBoxes = []
+        self.hoverBox = QRect()
+        self.last_detect_ms = 0.0
+        self._generation = 0
+        self._snap_task = None
+
+        # 拖拽停顿检测
+        self.dwellTimer = QTimer(self)
+        self.dwellTimer.setSingleShot(True)
+        self.dwellTimer.timeout.connect(self._on_dwell)
+        self.initUI()
         
     def initUI(self):
         try:
@@ -25,35 +82,12 @@ class ScreenshotWidget(QWidget):
             self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
             self.setAttribute(Qt.WA_TranslucentBackground)
             
-            # 获取屏幕信息
-            app = QApplication.instance()
-            desktop = app.desktop()
-            screen_geometry = desktop.screenGeometry()
-            
-            # 设置窗口覆盖整个屏幕
-            self.setGeometry(screen_geometry)
-            
-            # 获取屏幕截图
-            screen = app.primaryScreen()
-            if screen:
-                # 获取完整屏幕截图
-                self.screen = screen.grabWindow(0)
-                
-                # 如果截图大小与屏幕几何不匹配，进行缩放
-                if self.screen.size() != screen_geometry.size():
-                    self.screen = self.screen.scaled(
-                        screen_geometry.size(),
-                        Qt.KeepAspectRatio,
-                        Qt.SmoothTransformation
-                    )
-            else:
-                raise Exception("无法获取屏幕")
-            
-            # 设置光标
+            # 设置光标，并在未按下鼠标时也接收移动事件（用于候选框悬停）
             self.setCursor(QCursor(Qt.CrossCursor))
+            self.setMouseTracking(True)
             
             # 创建说明标签
-            self.tipLabel = QLabel('拖拽选择截图区域，按ESC退出', self)
+            self.tipLabel = QLabel('拖拽选择截图区域，或单击高亮的公式直接选中，按住Shift松开可持续监视该区域，按ESC退出', self)
             self.tipLabel.setStyleSheet("""
                 QLabel {
                     background-color: rgba(0, 0, 0, 180);
@@ -65,137 +99,382 @@ class ScreenshotWidget(QWidget):
             """)
             self.tipLabel.adjustSize()
             self.tipLabel.move(20, 20)
+
+            self.rubberBand = QRubberBand(QRubberBand.Rectangle, self)
+            self.rubberBand.hide()
             
         except Exception as e:
             print(f"初始化截图界面UI出错: {e}")
             raise e
+
+    def capture(self, start_time=None):
+        """抓取当前屏幕并显示选择窗口
+
+        Args:
+            start_time: 截图流程开始的时间（time.perf_counter），用于统计响应延迟
+        """
+        self._capture_start = start_time if start_time is not None else time.perf_counter()
+
+        # 只抓取光标所在的屏幕，多显示器时不必抓取全部屏幕
+        screen = QApplication.screenAt(QCursor.pos()) or QApplication.primaryScreen()
+        if not screen:
+            raise Exception("无法获取屏幕")
+        screen_geometry = screen.geometry()
+        self.currentScreen = screen
+
+        # 按屏幕的物理分辨率抓取，不再缩放到逻辑尺寸
+        self.screen = screen.grabWindow(0)
+        self.scale = self.screen.width() / max(1, screen_geometry.width())
+        # 设置设备像素比后，绘制到逻辑尺寸的窗口上时不需要重新采样
+        self.screen.setDevicePixelRatio(self.scale)
+
+        # 重置选区
+        self.rubberBand.hide()
+        self.origin = QPoint()
+        self._speculated_rect = QRect()
+        self.snapBoxes = []
+        self.hoverBox = QRect()
+        self._generation += 1
+
+        # 设置窗口覆盖该屏幕
+        if self.windowHandle():
+            self.windowHandle().setScreen(screen)
+        self.setGeometry(screen_geometry)
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        
+    def toPhysical(self, rect):
+        """将窗口中的逻辑坐标矩形映射为截图中的物理像素矩形"""
+        left = int(rect.left() * self.scale)
+        top = int(rect.top() * self.scale)
+        right = int(math.ceil((rect.right() + 1) * self.scale))
+        bottom = int(math.ceil((rect.bottom() + 1) * self.scale))
+        return QRect(left, top, right - left, bottom - top)
         
     def paintEvent(self, event):
         painter = QPainter(self)
         
         # 绘制截图作为背景
-        if hasattr(self, 'screen') and not self.screen.isNull():
+        if not self.screen.isNull():
             # 将截图绘制到整个窗口
             painter.drawPixmap(self.rect(), self.screen)
         
         # 绘制半透明遮罩
         painter.fillRect(self.rect(), QColor(0, 0, 0, 100))
         
+        # 未拖拽时高亮悬停的候选框
+        if not self.rubberBand.isVisible() and not self.hoverBox.isNull() and not self.screen.isNull():
+            painter.drawPixmap(self.hoverBox, self.screen, self.toPhysical(self.hoverBox))
+            painter.setPen(QPen(QColor(0, 150, 255), 2, Qt.DashLine))
+            painter.drawRect(self.hoverBox)
+
         # 如果有选择区域，绘制原始图像的该部分（不带遮罩）
-        if self.rubberBand and self.rubberBand.isVisible():
+        if self.rubberBand.isVisible():
             rect = self.rubberBand.geometry()
-            if hasattr(self, 'screen') and not self.screen.isNull():
+            if not self.screen.isNull():
                 # 绘制选择区域的原始截图（无遮罩）
-                painter.drawPixmap(rect, self.screen, rect)
+                painter.drawPixmap(rect, self.screen, self.toPhysical(rect))
                 
                 # 绘制选择框边框
                 pen = QPen(QColor(0, 150, 255), 2)  # 蓝色边框
                 painter.setPen(pen)
                 painter.drawRect(rect)
+
+        painter.end()
+
+        # 记录首次绘制的延迟
+        if self._capture_start is not None:
+            latency = (time.perf_counter() - self._capture_start) * 1000
+            self._capture_start = None
+            self.shown.emit(latency)
+            # 首次绘制完成后再开始检测候选框，不影响窗口显示
+            if cfg.screenshotSnap.value:
+                QTimer.singleShot(0, self._start_snap_detection)
+
+    def _start_snap_detection(self):
+        """在后台线程中检测当前截图的候选框"""
+        if not self.isVisible() or self.screen.isNull():
+            return
+        # QPixmap 只能在主线程使用，交给后台线程的是 QImage
+        self._snap_task = SnapDetectTask(self._generation, self.screen.toImage())
+        self._snap_task.signals.finished.connect(self._on_snap_detected)
+        QThreadPool.globalInstance().start(self._snap_task)
+
+    def _on_snap_detected(self, generation, boxes, elapsed):
+        """接收候选框，忽略之前截图的结果"""
+        self._snap_task = None
+        if generation != self._generation or not self.isVisible():
+            return
+        self.last_detect_ms = elapsed
+
+        # 物理像素映射回窗口逻辑坐标
+        s = self.scale
+        self.snapBoxes = [
+            QRect(int(x / s), int(y / s), int(math.ceil(w / s)), int(math.ceil(h / s)))
+            for x, y, w, h in boxes
+        ]
+        self._update_hover(self.mapFromGlobal(QCursor.pos()))
+
+    def boxAt(self, pos):
+        """包含该位置的最小候选框"""
+        best = QRect()
+        for box in self.snapBoxes:
+            if box.contains(pos) and (best.isNull() or box.width() * box.height() < best.width() * best.height()):
+                best = box
+        return best
+
+    def _update_hover(self, pos):
+        box = self.boxAt(pos)
+        if box != self.hoverBox:
+            self.hoverBox = box
+            self.update()
             
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.origin = event.pos()
-            if not self.rubberBand:
-                self.rubberBand = QRubberBand(QRubberBand.Rectangle, self)
             self.rubberBand.setGeometry(QRect(self.origin, event.pos()).normalized())
             self.rubberBand.show()
             
     def mouseMoveEvent(self, event):
-        if self.rubberBand:
+        if not self.rubberBand.isVisible():
+            self._update_hover(event.pos())
+            return
+
+        if self.rubberBand.isVisible():
             self.rubberBand.setGeometry(QRect(self.origin, event.pos()).normalized())
             self.update()
+
+            # 每次移动都重新计时，停顿足够久时提前识别当前选区
+            if cfg.screenshotSpeculative.value:
+                self.dwellTimer.start(cfg.screenshotSpeculativeDwell.value)
+
+    def _on_dwell(self):
+        """拖拽停顿，发出当前选区供后台提前识别"""
+        if not self.isVisible() or not self.rubberBand.isVisible():
+            return
+        rect = self.rubberBand.geometry()
+        if rect.width() <= 10 or rect.height() <= 10 or rect == self._speculated_rect:
+            return
+        self._speculated_rect = QRect(rect)
+        screenshot = self.screen.copy(self.toPhysical(rect))
+        screenshot.setDevicePixelRatio(1.0)
+        self.speculate.emit(screenshot)
             
     def mouseReleaseEvent(self, event):
-        if event.button() == Qt.LeftButton and self.rubberBand:
+        self.dwellTimer.stop()
+        if event.button() == Qt.LeftButton and self.rubberBand.isVisible():
             # 获取选择的区域
             rect = self.rubberBand.geometry()
-            if rect.width() > 10 and rect.height() > 10:  # 确保选择区域足够大
-                # 截取选择的区域
-                screenshot = self.screen.copy(rect)
+            snapped = False
+
+            # 没有拖动（单击）时选中鼠标下的候选框
+            moved = (event.pos() - self.origin).manhattanLength()
+            if moved < QApplication.startDragDistance():
+                box = self.boxAt(event.pos())
+                if box.isNull():
+                    self.rubberBand.hide()
+                    self._update_hover(event.pos())
+                    return
+                rect = QRect(box)
+                snapped = True
+
+            if snapped or (rect.width() > 10 and rect.height() > 10):  # 确保拖拽的选择区域足够大
+                # 按住 Shift 时进入区域监视模式
+                if event.modifiers() & Qt.ShiftModifier:
+                    self.hide()
+                    self.watchSelected.emit(self.currentScreen, QRect(rect))
+                    return
+
+                # 从原始分辨率的截图中截取选择的区域
+                screenshot = self.screen.copy(self.toPhysical(rect))
+                screenshot.setDevicePixelRatio(1.0)
+                self.hide()
                 self.screenshotSelected.emit(screenshot)
-                self.close()
             
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
-            self.close()
+            self.dwellTimer.stop()
+            self.hide()
+            self.cancelled.emit()
         super().keyPressEvent(event)
 
 
 class ScreenshotManager:
     """截图管理器"""
+
+    # 等待主窗口隐藏的最长时间（毫秒），超时后照常截图
+    HIDE_TIMEOUT = 200
+    FRAME_MS = 16
     
     def __init__(self, parent=None):
         self.parent = parent
-        self.screenshot_widget = None
+        self._capturing = False  # 正在等待主窗口隐藏
+        self.save_dir = os.path.join(tempfile.gettempdir(), "LatexOCR-GUI", "screenshots")
+        # 快捷键到截图窗口显示的延迟记录（毫秒）
+        self.latencies = deque(maxlen=50)
+
+        # 预先创建截图窗口，快捷键按下时直接复用
+        self.screenshot_widget = ScreenshotWidget()
+        self.screenshot_widget.screenshotSelected.connect(self._on_screenshot_selected)
+        self.screenshot_widget.speculate.connect(self._on_speculate)
+        self.screenshot_widget.cancelled.connect(self._show_main_window)
+        self.screenshot_widget.shown.connect(self._on_overlay_shown)
+        self.screenshot_widget.watchSelected.connect(self._on_watch_selected)
+
+        # 区域监视
+        self.region_watcher = RegionWatcher(
+            interval=cfg.watchInterval.value,
+            stable_frames=cfg.watchStableFrames.value,
+            change_ratio=cfg.watchChangeRatio.value / 1000
+        )
+        self.region_watcher.regionChanged.connect(self._on_region_changed)
+        self.region_watcher.stateChanged.connect(self._on_watch_state_changed)
+        self.region_watcher.pausedChanged.connect(self._on_watch_paused_changed)
         
     def take_screenshot(self):
         """开始截图"""
+        # 截图尚未结束时忽略重复的快捷键
+        if self._capturing or self.screenshot_widget.isVisible():
+            return
+
+        start_time = time.perf_counter()
         try:
-            # 隐藏主窗口（如果存在）
-            if self.parent:
+            # 重新截图时停止区域监视
+            self.stop_watch()
+
+            # 隐藏主窗口（如果存在），等隐藏真正生效后再截图，不再固定等待
+            if self.parent and self.parent.isVisible():
+                self._capturing = True
                 self.parent.hide()
-                
-            # 延迟一下让窗口完全隐藏
-            QTimer.singleShot(200, self._show_screenshot_widget)
+                QTimer.singleShot(0, lambda: self._capture_when_hidden(start_time))
+            else:
+                self._show_screenshot_widget(start_time)
             
         except Exception as e:
             print(f"截图流程出错: {e}")
+            self._capturing = False
             if self.parent:
                 self.parent.show()
+
+    def _capture_when_hidden(self, start_time):
+        """主窗口不再显示在屏幕上之后截图"""
+        handle = self.parent.windowHandle()
+        waited = (time.perf_counter() - start_time) * 1000
+        if handle is not None and handle.isExposed() and waited < self.HIDE_TIMEOUT:
+            QTimer.singleShot(self.FRAME_MS, lambda: self._capture_when_hidden(start_time))
+            return
+        # 再等一帧，让合成器把主窗口从屏幕上移除
+        QTimer.singleShot(self.FRAME_MS, lambda: self._finish_capture(start_time))
+
+    def _finish_capture(self, start_time):
+        self._capturing = False
+        self._show_screenshot_widget(start_time)
         
-    def _show_screenshot_widget(self):
+    def _show_screenshot_widget(self, start_time=None):
         """显示截图选择窗口"""
         try:
-            # 如果之前的截图窗口还存在，先关闭它
-            if self.screenshot_widget:
-                self.screenshot_widget.close()
-                self.screenshot_widget = None
-                
-            self.screenshot_widget = ScreenshotWidget()
-            self.screenshot_widget.screenshotSelected.connect(self._on_screenshot_selected)
-            self.screenshot_widget.show()
-            
+            self.screenshot_widget.capture(start_time)
         except Exception as e:
             print(f"显示截图窗口出错: {e}")
-            if self.parent:
-                self.parent.show()
+            self._show_main_window()
+
+    def _on_watch_selected(self, screen, rect):
+        """开始监视选中的区域"""
+        self._show_main_window()
+        self.region_watcher.start(screen, rect, exclude=[self.parent] if self.parent else ())
+
+    def stop_watch(self):
+        """停止区域监视"""
+        self.region_watcher.stop()
+
+    def _on_region_changed(self, image):
+        from ..common.signal_bus import signalBus
+        signalBus.regionWatchCaptured.emit(image)
+
+    def _on_watch_state_changed(self, watching):
+        from ..common.signal_bus import signalBus
+        signalBus.regionWatchStateChanged.emit(watching)
+
+    def _on_watch_paused_changed(self, paused):
+        from ..common.signal_bus import signalBus
+        signalBus.regionWatchPausedChanged.emit(paused)
+
+    def _on_overlay_shown(self, latency):
+        """记录快捷键到截图窗口显示的延迟"""
+        self.latencies.append(latency)
+
+    def latency_stats(self):
+        """截图窗口显示延迟的统计（毫秒）"""
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return {
+            'count': len(values),
+            'last': self.latencies[-1],
+            'median': values[len(values) // 2],
+            'max': values[-1]
+        }
         
     def _on_screenshot_selected(self, pixmap):
-        """处理截图选择完成"""
+        """处理截图选择完成（直接在内存中传递图像，不再经过临时文件）"""
         try:
-            # 先关闭截图窗口
-            if self.screenshot_widget:
-                self.screenshot_widget.close()
-                self.screenshot_widget = None
-            
-            # 保存截图到临时文件
-            temp_dir = tempfile.gettempdir()
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            temp_file = os.path.join(temp_dir, f"screenshot_{timestamp}.png")
-            
-            if pixmap.save(temp_file, "PNG"):
-                # 先显示主窗口，再发送截图完成信号
-                self._show_main_window()
-                
-                # 延迟一下再发送信号，确保主窗口已经显示
-                QTimer.singleShot(100, lambda: self._emit_screenshot_signal(temp_file))
-            else:
-                self._show_main_window()
-                
+            image = pixmap.toImage()
+
+            # 先显示主窗口，再发送截图完成信号
+            self._show_main_window()
+            self._emit_screenshot_signal(image)
+
+            # 可选：识别开始后再把截图保存到磁盘
+            if cfg.screenshotSaveToDisk.value:
+                QTimer.singleShot(0, lambda: self._save_to_disk(image))
+
         except Exception as e:
             print(f"处理截图选择出错: {e}")
             if self.parent:
                 self.parent.show()
-                
-    def _emit_screenshot_signal(self, temp_file):
+
+    def _on_speculate(self, pixmap):
+        """转发拖拽停顿时的选区"""
+        from ..common.signal_bus import signalBus
+        signalBus.screenshotSpeculate.emit(pixmap.toImage())
+
+    def _emit_screenshot_signal(self, image):
         """发送截图完成信号"""
         try:
             from ..common.signal_bus import signalBus
-            signalBus.screenshotTaken.emit(temp_file)
+            signalBus.screenshotTaken.emit(image)
         except Exception as e:
             print(f"发送截图信号出错: {e}")
-            
+
+    def _save_to_disk(self, image):
+        """保存截图到临时目录，并只保留最近的若干张"""
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            image.save(os.path.join(self.save_dir, f"screenshot_{timestamp}.png"), "PNG")
+            self._prune_files(cfg.screenshotMaxFiles.value)
+        except Exception as e:
+            print(f"保存截图出错: {e}")
+
+    def _prune_files(self, keep):
+        """删除多余的旧截图"""
+        if not os.path.isdir(self.save_dir):
+            return
+        files = sorted(
+            (f for f in os.listdir(self.save_dir) if f.startswith("screenshot_") and f.endswith(".png")),
+            reverse=True
+        )
+        for name in files[keep:]:
+            try:
+                os.remove(os.path.join(self.save_dir, name))
+            except OSError as e:
+                print(f"删除截图文件出错: {e}")
+
+    def cleanup(self):
+        """清理保存到磁盘的截图"""
+        self._prune_files(0)
+
     def _show_main_window(self):
         """显示主窗口"""
         try:
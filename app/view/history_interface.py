@@ -1,5 +1,7 @@
-from PyQt5.QtCore import Qt, QSize, QTimer
-from PyQt5.QtGui import QPixmap, QImage
+import os
+
+from PyQt5.QtCore import Qt, QSize, QTimer, QUrl
+from PyQt5.QtGui import QImage, QImageReader
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, 
                            QLabel, QTableWidgetItem, QHeaderView,
                            QApplication, QScrollArea)
@@ -8,10 +10,12 @@ from qfluentwidgets import (SearchLineEdit, PrimaryPushButton, TableWidget,
                           InfoBarPosition, MessageBox, PrimaryToolButton,
                           PushButton)
 from qfluentwidgets import FluentIcon as FIF
-import base64
 from datetime import datetime  # 添加到文件顶部的导入部分
 
-from ..common.db_manager import DatabaseManager
+from ..common.db_manager import DatabaseManager, decode_image_data
+from ..common.imaging import pixmap_from_bytes
+from ..common.render_cache import renderCache
+from ..components.latex_renderer import LaTeXRenderer
 
 class ClickableLabel(QLabel):
     """可点击的标签"""
@@ -202,15 +206,17 @@ class HistoryInterface(QScrollArea):
             
             # 图片
             image_label = ClickableLabel(self)
-            image_data = base64.b64decode(image_data)
-            pixmap = QPixmap()
-            pixmap.loadFromData(image_data)
+            pixmap = pixmap_from_bytes(decode_image_data(image_data))
             scaled_pixmap = pixmap.scaled(80, 80, Qt.KeepAspectRatio, Qt.SmoothTransformation)
             image_label.setPixmap(scaled_pixmap)
             self.table.setCellWidget(row, 1, image_label)
             
-            # LaTeX结果
-            self.table.setItem(row, 2, ClickableItem(latex_result, True))
+            # LaTeX结果（复制过图片的公式悬停时显示渲染缓存中的预览）
+            latexItem = ClickableItem(latex_result, True)
+            preview = self.previewToolTip(latex_result)
+            if preview:
+                latexItem.setToolTip(preview)
+            self.table.setItem(row, 2, latexItem)
             
             # 置信度
             self.table.setItem(row, 3, QTableWidgetItem(f"{confidence:.1%}"))
@@ -237,6 +243,18 @@ class HistoryInterface(QScrollArea):
             buttonLayout.addWidget(deleteButton, 0, Qt.AlignCenter)
             self.table.setCellWidget(row, 5, buttonContainer)
 
+    def previewToolTip(self, latex):
+        """渲染缓存中有该公式的图片时，返回显示图片的富文本提示"""
+        if not latex:
+            return None
+        scale = self.devicePixelRatioF()
+        path = renderCache.disk_path(latex, 'png', **LaTeXRenderer.image_options_for(scale))
+        if not path:
+            return None
+        width = int(QImageReader(path).size().width() / scale)
+        url = QUrl.fromLocalFile(os.path.abspath(path)).toString()
+        return f'<img src="{url}" width="{width}">'
+
     def showEmptyHint(self):
         """显示空记录提示"""
         self.table.setRowCount(1)
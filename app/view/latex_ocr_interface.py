@@ -11,11 +11,15 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout,
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from PyQt5.QtCore import QUrl
 from ..common.config import cfg
-import cv2
-import numpy as np
 from ..components.latex_renderer import LaTeXRenderer
 from ..common.db_manager import DatabaseManager
 from ..common.ocr_service import OcrServiceFactory
+from ..common.ocr_worker import OcrWorker
+from ..common.phash_index import PerceptualIndex, dhash, hash_to_hex
+from ..common.imaging import qimage_to_bgr
+from ..common.ocr_cache import image_key
+from ..common.preflight import check_image, REJECT, WARN
+
 
 
 class DrawingBoard(QWidget):
@@ -160,7 +164,8 @@ class DrawingBoard(QWidget):
             self.update()
         
     def getImage(self):
-        image = QImage(self.size(), QImage.Format_RGB888)
+        # RGB32 可以被 qimage_to_bgr 直接映射为数组，无需转换格式
+        image = QImage(self.size(), QImage.Format_RGB32)
         image.fill(Qt.white)
         painter = QPainter(image)
         painter.setRenderHint(QPainter.Antialiasing)
@@ -230,6 +235,18 @@ class DrawingDialog(QDialog):
                 parent=self
             )
             return
+
+        # 笔迹全部被擦除或过小时同样不提交（提高容差，忽略浅灰色的网格线）
+        level, message, _ = check_image(qimage_to_bgr(self.getImage()), tolerance=96)
+        if level == REJECT:
+            InfoBar.warning(
+                title='提示',
+                content=message,
+                duration=2000,
+                position=InfoBarPosition.TOP,
+                parent=self
+            )
+            return
         self.accept()  # 有内容时才接受对话框
 
     def confirmClear(self):
@@ -268,10 +285,20 @@ class LatexOcrInterface(ScrollArea):
             }
         """)
         self.stateTooltip = None
+        self.sourceImage = None  # 识别用的原始图像，与界面显示的缩略图分开保存
         self.updateTimer = QTimer()
         self.updateTimer.setSingleShot(True)
         self.updateTimer.timeout.connect(self.doUpdateLatex)
         self.ocr_service = OcrServiceFactory.create_service()  # 创建识别服务
+        # 后台识别调度器，避免网络请求阻塞界面
+        self.ocrWorker = OcrWorker(self.ocr_service, self)
+        self.ocrWorker.finished.connect(self.onRecognizeFinished)
+        # 截图拖拽停顿时的提前识别，使用单独的调度器，不会取消正常识别
+        self.speculativeWorker = OcrWorker(self.ocr_service, self, max_thread_count=1)
+        self.speculativeWorker.finished.connect(self.onSpeculativeFinished)
+        self.speculation = None  # {'key', 'result', 'adopted'}
+        # 历史图片的感知哈希索引，用于发现相似的已识别图片
+        self.phashIndex = PerceptualIndex(self.db)
         self.initUI()
 
     def initUI(self):
@@ -474,6 +501,7 @@ class LatexOcrInterface(ScrollArea):
             self, "选择图片", "./", "Images (*.png *.jpg *.jpeg *.bmp)"
         )
         if file_path:
+            self.sourceImage = QImage(file_path)
             self.imageLabel.setImage(file_path)
             InfoBar.success(
                 title='上传成功',
@@ -488,77 +516,39 @@ class LatexOcrInterface(ScrollArea):
     def pasteImage(self):
         self.handlePaste()
         
-    def recognizeFormula(self, from_drawing=False, drawing_image=None):
-        """识别公式"""
-        # 显示加载状态
-        self.showLoading()
-        
+    def recognizeFormula(self):
+        """识别公式（在后台线程中执行，新的识别会取代尚未完成的旧识别）"""
         try:
-            # 获取图像
-            if from_drawing and drawing_image:
-                # 从手写板获取图像
-                image = drawing_image
-                width = image.width()
-                height = image.height()
-                ptr = image.bits()
-                ptr.setsize(height * width * 3)
-                arr = np.frombuffer(ptr, np.uint8).reshape((height, width, 3))
-                img = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-            else:
-                # 从imageLabel获取图像
-                pixmap = self.imageLabel.pixmap()
-                if not pixmap:
-                    return
-                image = pixmap.toImage()
-                width = image.width()
-                height = image.height()
-                ptr = image.bits()
-                ptr.setsize(height * width * 4)
-                arr = np.frombuffer(ptr, np.uint8).reshape((height, width, 4))
-                img = cv2.cvtColor(arr, cv2.COLOR_RGBA2BGR)
-            
-            # 调用识别服务
-            result = self.ocr_service.recognize(img)
-            
-            if result['status']:
-                # 立即显示结果区域和基本信息，让用户知道识别已完成
-                self.showResult()
-                
-                # 立即更新文本内容
-                self.resultEdit.setText(result['latex'])
-                
-                # 立即更新置信度显示
-                confidence_value = int(result['confidence'] * 100)
-                self.confidenceBar.setValue(confidence_value)
-                self.confidenceValueLabel.setText(f"{confidence_value}%")
-                self.updateConfidenceColor(confidence_value)
-                
-                # 显示成功信息
-                InfoBar.success(
-                    title='识别成功',
-                    content=f'置信度: {result["confidence"]:.2%}',
-                    duration=2000,
-                    position=InfoBarPosition.TOP,
-                    parent=self
-                )
-                
-                # 延迟渲染LaTeX（避免阻塞UI）
-                QTimer.singleShot(50, lambda: self.updateRender())
-                
-                # 保存历史记录（异步进行）
-                QTimer.singleShot(100, lambda: self.saveRecord(img, result))
-                
-            else:
-                InfoBar.error(
-                    title='识别失败',
-                    content=result['message'],
-                    duration=2000,
-                    position=InfoBarPosition.TOP,
-                    parent=self
-                )
-                
+            # 使用原始分辨率的图像识别，而不是界面上的缩略图
+            if self.sourceImage is None or self.sourceImage.isNull():
+                return
+            img = qimage_to_bgr(self.sourceImage)
+
+            # 空白、纯色、过小的图片直接在本地拦截；之前的识别结果不能显示在这张图下面
+            if not self.preflight(img):
+                self.ocrWorker.cancel()
+                self.speculativeWorker.cancel()
+                self.speculation = None
+                self.hideLoading()
+                return
+
+            # 与提前识别的选区内容相同时，直接复用其结果
+            if self.adoptSpeculation(img):
+                return
+
+            # 查找相似的历史识别结果
+            if self.checkNearDuplicate(img):
+                return
+
+            # 显示加载状态
+            self.showLoading()
+
+            # 提交到后台识别（多公式图片会分区域识别）
+            self.ocrWorker.submit(img, layout=cfg.layoutDetect.value)
+
         except Exception as e:
             print(f"Error details: {str(e)}")
+            self.hideLoading()
             InfoBar.error(
                 title='请求失败',
                 content=str(e),
@@ -566,22 +556,230 @@ class LatexOcrInterface(ScrollArea):
                 position=InfoBarPosition.TOP,
                 parent=self
             )
-        finally:
-            self.hideLoading()
 
-    def saveRecord(self, img, result):
-        """异步保存历史记录"""
-        try:
-            _, img_encoded = cv2.imencode('.png', img)
-            record_id = self.db.add_record(
-                img_encoded.tobytes(),
-                result['latex'],
-                result['confidence'],
-                result['request_id']
+    def preflight(self, img):
+        """
+        上传前检查图片，拦截时给出提示
+        Returns:
+            bool: 是否继续识别
+        """
+        if not cfg.preflightEnabled.value:
+            return True
+
+        level, message, _ = check_image(img)
+        if level == REJECT:
+            InfoBar.warning(
+                title='已跳过识别',
+                content=message,
+                duration=2000,
+                position=InfoBarPosition.TOP,
+                parent=self
+            )
+            return False
+        if level == WARN:
+            InfoBar.warning(
+                title='提示',
+                content=message,
+                duration=2000,
+                position=InfoBarPosition.TOP,
+                parent=self
+            )
+        return True
+
+    def onRecognizeFinished(self, job_id, result, image):
+        """后台识别完成（只会收到最新一次识别的结果）"""
+        self.hideLoading()
+
+        if result is None:
+            return
+
+        if result['status']:
+            self.showRecognizeResult(result)
+
+            # 显示成功信息
+            content = f'置信度: {result["confidence"]:.2%}'
+            if 'regions' in result:
+                content = f'共 {len(result["regions"])} 个公式，最低{content}'
+            InfoBar.success(
+                title='识别成功',
+                content=content,
+                duration=2000,
+                position=InfoBarPosition.TOP,
+                parent=self
             )
-            self.current_record_id = record_id
+
+            # 保存历史记录（异步进行）
+            QTimer.singleShot(100, lambda: self.saveRecord(image, result))
+
+        else:
+            InfoBar.error(
+                title='识别失败',
+                content=result['message'],
+                duration=2000,
+                position=InfoBarPosition.TOP,
+                parent=self
+            )
+
+    def speculate(self, image):
+        """截图拖拽停顿时，在后台提前识别当前选区"""
+        try:
+            img = qimage_to_bgr(image)
+            if cfg.preflightEnabled.value and check_image(img)[0] == REJECT:
+                return
+            image = self.ocr_service.prepare(img)
+            self.speculation = {'key': image.key, 'result': None, 'adopted': False}
+            # 新的停顿会取代之前的提前识别；与最终识别使用相同的分区域设置，结果才能直接复用
+            self.speculativeWorker.submit(image, layout=cfg.layoutDetect.value)
+        except Exception as e:
+            print(f"提前识别失败: {e}")
+            self.speculation = None
+
+    def onSpeculativeFinished(self, job_id, result, image):
+        """提前识别完成"""
+        speculation = self.speculation
+        if speculation is None or speculation['key'] != image.key:
+            return
+
+        speculation['result'] = (job_id, result, image)
+        if speculation['adopted']:
+            # 用户已经松开鼠标，正在等待这个结果
+            self.speculation = None
+            self.onRecognizeFinished(job_id, result, image)
+
+    def adoptSpeculation(self, img):
+        """
+        最终截图与提前识别的选区内容相同时复用其结果，否则取消提前识别
+        Returns:
+            bool: 是否已复用
+        """
+        speculation = self.speculation
+        if speculation is None:
+            return False
+
+        if image_key(img) != speculation['key']:
+            self.speculativeWorker.cancel()
+            self.speculation = None
+            return False
+
+        # 取代正在进行的普通识别
+        self.ocrWorker.cancel()
+        if speculation['result'] is not None:
+            self.speculation = None
+            self.onRecognizeFinished(*speculation['result'])
+        else:
+            speculation['adopted'] = True
+            self.showLoading()
+        return True
+
+    def showRecognizeResult(self, result):
+        """显示识别结果"""
+        # 立即显示结果区域和基本信息，让用户知道识别已完成
+        self.showResult()
+
+        # 立即更新文本内容
+        self.resultEdit.setText(result['latex'])
+
+        # 立即更新置信度显示
+        confidence_value = int(result['confidence'] * 100)
+        self.confidenceBar.setValue(confidence_value)
+        self.confidenceValueLabel.setText(f"{confidence_value}%")
+        self.updateConfidenceColor(confidence_value)
+
+        # 延迟渲染LaTeX（避免阻塞UI）
+        QTimer.singleShot(50, lambda: self.updateRender())
+
+    def checkNearDuplicate(self, img):
+        """查找相似的历史图片
+
+        Returns:
+            bool: 是否已直接使用历史结果（无需再请求识别接口）
+        """
+        mode = cfg.nearDuplicateMode.value
+        if mode == 'Off':
+            return False
+
+        try:
+            match = self.phashIndex.find(dhash(img), cfg.nearDuplicateThreshold.value)
         except Exception as e:
-            print(f"保存历史记录失败: {str(e)}")
+            print(f"相似图片查找失败: {e}")
+            return False
+        if not match:
+            return False
+
+        distance, record = match
+        if mode == 'Auto':
+            self.ocrWorker.cancel()
+            self.useHistoryRecord(record)
+            return True
+
+        # 提示模式：照常识别，同时提供直接使用历史结果的选项
+        bar = InfoBar.info(
+            title='发现相似图片',
+            content=f'历史记录 #{record[0]} 与当前图片相似（差异 {distance}）',
+            duration=5000,
+            position=InfoBarPosition.TOP,
+            parent=self
+        )
+        useButton = PushButton('使用历史结果', bar)
+        useButton.clicked.connect(lambda: self.onUseHistoryClicked(record, bar))
+        bar.addWidget(useButton)
+        return False
+
+    def onUseHistoryClicked(self, record, bar):
+        """放弃正在进行的识别，改用相似的历史结果"""
+        self.ocrWorker.cancel()
+        self.hideLoading()
+        self.useHistoryRecord(record)
+        bar.close()
+
+    def useHistoryRecord(self, record):
+        """直接使用历史记录中的识别结果"""
+        record_id, _, _, latex_result, confidence, request_id = record
+        self.current_record_id = record_id
+        self.showRecognizeResult({
+            'status': True,
+            'latex': latex_result,
+            'confidence': confidence,
+            'request_id': request_id,
+            'message': None
+        })
+        InfoBar.success(
+            title='已使用历史结果',
+            content=f'来自历史记录 #{record_id}',
+            duration=2000,
+            position=InfoBarPosition.TOP,
+            parent=self
+        )
+
+    def saveRecord(self, image, result):
+        """异步保存历史记录（原图已在后台线程中编码）
+
+        多公式图片的每个区域分别保存为一条记录。此时编辑框中是合并后的公式，
+        不对应任何一条记录，编辑后不再回写数据库。
+        """
+        regions = 'regions' in result
+        if regions:
+            entries = [(r['image'], r['result']) for r in result['regions'] if r['result']['status']]
+            self.current_record_id = None
+        else:
+            entries = [(image, result)]
+
+        for image, result in entries:
+            try:
+                phash = dhash(image.pixels)
+                record_id = self.db.add_record(
+                    image.source_data,
+                    result['latex'],
+                    result['confidence'],
+                    result['request_id'],
+                    hash_to_hex(phash),
+                    image.key
+                )
+                if not regions:
+                    self.current_record_id = record_id
+                self.phashIndex.add(phash, record_id)
+            except Exception as e:
+                print(f"保存历史记录失败: {str(e)}")
 
     def updateConfidenceColor(self, confidence_value):
         """更新置信度进度条颜色"""
@@ -675,8 +873,19 @@ class LatexOcrInterface(ScrollArea):
     def copyImage(self):
         """复制渲染后的公式图像"""
         try:
-            # 等待渲染完成
-            QTimer.singleShot(500, self._do_copy_image)
+            # 同一公式之前复制过图片时直接使用缓存
+            latex = self.resultEdit.toPlainText()
+            pixmap = self.latexRenderer.cached_image(latex) if latex.strip() else None
+            if pixmap is not None and not pixmap.isNull():
+                QApplication.clipboard().setPixmap(pixmap)
+                self.showCopySuccess('图像')
+                return
+
+            # 还有未提交的编辑时立即渲染，渲染完成后再复制
+            if self.updateTimer.isActive():
+                self.updateTimer.stop()
+                self.doUpdateLatex()
+            self.latexRenderer.whenRendered(self._do_copy_image)
         except Exception as e:
             InfoBar.error(
                 title='复制失败',
@@ -692,6 +901,10 @@ class LatexOcrInterface(ScrollArea):
             # 获取渲染后的图片
             pixmap = self.latexRenderer.get_image()
             if pixmap:
+                # 只缓存确认渲染完成的结果（等待超时时截取的画面可能不完整）
+                latex = self.resultEdit.toPlainText()
+                if latex.strip() and not self.latexRenderer.isRendering():
+                    self.latexRenderer.cache_image(latex, pixmap)
                 # 复制到剪贴板
                 QApplication.clipboard().setPixmap(pixmap)
                 self.showCopySuccess('图像')
@@ -736,6 +949,9 @@ class LatexOcrInterface(ScrollArea):
         if mimeData.hasImage():
             pixmap = clipboard.pixmap()
             if not pixmap.isNull():
+                # 保存原始图像用于识别，缩放只影响显示
+                self.sourceImage = clipboard.image()
+
                 # 获取设备像素比
                 device_ratio = self.devicePixelRatio()
                 # 设置图片的设备像素比
@@ -792,6 +1008,7 @@ class LatexOcrInterface(ScrollArea):
         if dialog.exec_():
             # 如果点击了识别按钮
             image = dialog.getImage()
+            self.sourceImage = image
             # 显示图片（缩放到合适的尺寸）
             pixmap = QPixmap.fromImage(image)
             scaled_pixmap = pixmap.scaled(
@@ -810,7 +1027,7 @@ class LatexOcrInterface(ScrollArea):
                 parent=self
             )
             # 使用定时器延迟一下，确保UI更新后再开始识别
-            QTimer.singleShot(100, lambda: self.recognizeFormula(from_drawing=True, drawing_image=image))
+            QTimer.singleShot(100, self.recognizeFormula)
             
     def onLatexChanged(self):
         """处理 LaTeX 文本变化（带防抖）"""
@@ -822,19 +1039,20 @@ class LatexOcrInterface(ScrollArea):
         # 更新渲染
         self.updateRender()
         # 更新数据库
-        if hasattr(self, 'current_record_id'):
+        if getattr(self, 'current_record_id', None) is not None:
             print(f"Updating latex for record ID: {self.current_record_id}")  # 打印当前记录ID
             self.db.update_latex(self.current_record_id, latex)
         else:
             print("No current_record_id available")  # 打印没有ID的情况 
 
-    def loadScreenshot(self, image_path):
+    def loadScreenshot(self, image):
         """加载截图并开始识别"""
         try:
             # 显示截图
-            self.imageLabel.setImage(image_path)
+            self.sourceImage = image
+            self.imageLabel.setImage(image)
             self.imageLabel.show()
-            
+
             # 显示成功信息
             InfoBar.success(
                 title='截图成功',
@@ -843,10 +1061,10 @@ class LatexOcrInterface(ScrollArea):
                 position=InfoBarPosition.TOP,
                 parent=self
             )
-            
-            # 延迟一下让UI更新，然后开始识别
-            QTimer.singleShot(200, self.recognizeFormula)
-            
+
+            # 识别在后台线程中进行，无需等待界面刷新
+            self.recognizeFormula()
+
         except Exception as e:
             InfoBar.error(
                 title='截图加载失败',
@@ -854,4 +1072,4 @@ class LatexOcrInterface(ScrollArea):
                 duration=2000,
                 position=InfoBarPosition.TOP,
                 parent=self
-            )
\ No newline at end of file
+            )
@@ -5,7 +5,8 @@ from PyQt5.QtGui import QIcon, QDesktopServices, QColor, QPainter, QImage, QBrus
 from PyQt5.QtWidgets import QApplication
 
 from qfluentwidgets import (NavigationAvatarWidget, NavigationItemPosition, MessageBox, FluentWindow,
-                            SplashScreen, SystemThemeListener, isDarkTheme, NavigationWidget)
+                            SplashScreen, SystemThemeListener, isDarkTheme, NavigationWidget,
+                            InfoBar, InfoBarPosition, PushButton)
 from qfluentwidgets import FluentIcon as FIF
 
 from .gallery_interface import GalleryInterface
@@ -102,6 +103,7 @@ class MainWindow(FluentWindow):
 
         # 初始化截图管理器
         self.screenshotManager = ScreenshotManager(self)
+        self.regionWatchBar = None
 
         # enable acrylic effect
         self.navigationInterface.setAcrylicEnabled(True)
@@ -123,6 +125,10 @@ class MainWindow(FluentWindow):
         # 连接快捷键和截图相关信号
         signalBus.screenshotHotkeyChanged.connect(self.updateScreenshotHotkey)
         signalBus.screenshotTaken.connect(self.onScreenshotTaken)
+        signalBus.screenshotSpeculate.connect(self.latexOcrInterface.speculate)
+        signalBus.regionWatchCaptured.connect(self.latexOcrInterface.loadScreenshot)
+        signalBus.regionWatchStateChanged.connect(self.onRegionWatchStateChanged)
+        signalBus.regionWatchPausedChanged.connect(self.onRegionWatchPausedChanged)
         
         # 初始化快捷键
         self.initHotkey()
@@ -212,6 +218,19 @@ class MainWindow(FluentWindow):
         
         # 停止全局快捷键监听
         global_hotkey_manager.stop()
+
+        # 取消尚未完成的识别任务
+        self.latexOcrInterface.ocrWorker.shutdown()
+        self.latexOcrInterface.speculativeWorker.shutdown()
+
+        # 停止区域监视并删除保存到磁盘的截图
+        self.screenshotManager.stop_watch()
+        self.screenshotManager.cleanup()
+
+        # 写回识别缓存的访问记录
+        cache = getattr(self.latexOcrInterface.ocr_service, 'cache', None)
+        if cache:
+            cache.flush()
         
         super().closeEvent(e)
 
@@ -264,9 +283,50 @@ class MainWindow(FluentWindow):
         """截图快捷键按下处理"""
         self.screenshotManager.take_screenshot()
         
-    def onScreenshotTaken(self, image_path):
+    def onScreenshotTaken(self, image):
         """截图完成处理"""
         # 切换到公式识别界面
         self.stackedWidget.setCurrentWidget(self.latexOcrInterface, False)
         # 加载截图到OCR界面
-        self.latexOcrInterface.loadScreenshot(image_path)
+        self.latexOcrInterface.loadScreenshot(image)
+
+    def onRegionWatchStateChanged(self, watching):
+        """区域监视开始时显示提示，并提供停止按钮"""
+        if not watching:
+            self.closeRegionWatchBar()
+            return
+
+        self.stackedWidget.setCurrentWidget(self.latexOcrInterface, False)
+        self.showRegionWatchBar(paused=False)
+
+    def onRegionWatchPausedChanged(self, paused):
+        """监视区域被主窗口遮挡时提示用户移开窗口"""
+        if self.regionWatchBar:
+            self.showRegionWatchBar(paused)
+
+    def closeRegionWatchBar(self):
+        if self.regionWatchBar:
+            self.regionWatchBar.close()
+            self.regionWatchBar = None
+
+    def showRegionWatchBar(self, paused):
+        self.closeRegionWatchBar()
+        if paused:
+            self.regionWatchBar = InfoBar.warning(
+                title='区域监视已暂停',
+                content='监视区域被本窗口遮挡，移开或最小化窗口后继续',
+                duration=-1,
+                position=InfoBarPosition.BOTTOM,
+                parent=self.latexOcrInterface
+            )
+        else:
+            self.regionWatchBar = InfoBar.info(
+                title='正在监视区域',
+                content='区域内容变化后会自动识别并保存到历史记录',
+                duration=-1,
+                position=InfoBarPosition.BOTTOM,
+                parent=self.latexOcrInterface
+            )
+        stopButton = PushButton('停止监视', self.regionWatchBar)
+        stopButton.clicked.connect(self.screenshotManager.stop_watch)
+        self.regionWatchBar.addWidget(stopButton)
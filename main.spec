@@ -1,11 +1,16 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
+
+# 打包后的程序必须离线可用，MathJax 需要事先下载到资源目录
+if not os.path.isfile(os.path.join('app', 'resource', 'mathjax', 'tex-svg.js')):
+    raise SystemExit('缺少 app/resource/mathjax/tex-svg.js，请先运行 python -m app.common.mathjax 下载 MathJax')
 
 
 a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('app/resource/mathjax', 'app/resource/mathjax')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
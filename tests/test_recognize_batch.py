@@ -0,0 +1,113 @@
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+for module in ('numpy', 'cv2', 'requests', 'qfluentwidgets'):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from app.common.ocr_service import BaseOcrService, CachedOcrService  # noqa: E402
+
+
+class StubService(BaseOcrService):
+    """按图片内容返回结果的识别服务，随机延迟使完成顺序被打乱"""
+
+    def prepare(self, image_data):
+        return SimpleNamespace(key=f'key-{image_data}', value=image_data)
+
+    def recognize(self, image_data):
+        image = self.prepare(image_data) if not isinstance(image_data, SimpleNamespace) else image_data
+        time.sleep(random.uniform(0, 0.01))
+        return {'status': True, 'latex': f'x_{{{image.value}}}', 'confidence': 1.0,
+                'request_id': None, 'message': None}
+
+
+class DictCache:
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, result):
+        self.entries[key] = result
+
+
+def collect(service, images, max_concurrency=4):
+    results = {}
+    for index, result in service.recognize_batch(images, max_concurrency):
+        assert index not in results
+        results[index] = result
+    return results
+
+
+def test_base_recognize_batch_returns_every_index():
+    images = list(range(20))
+    results = collect(StubService(), iter(images))
+    assert sorted(results) == images
+    assert all(results[i]['latex'] == f'x_{{{i}}}' for i in images)
+
+
+def test_cached_recognize_batch_all_misses():
+    images = list(range(20))
+    cache = DictCache()
+    results = collect(CachedOcrService(StubService(), cache), iter(images))
+    assert sorted(results) == images
+    assert all(results[i]['latex'] == f'x_{{{i}}}' for i in images)
+    assert set(cache.entries) == {f'key-{i}' for i in images}
+
+
+def test_cached_recognize_batch_mixed_hits():
+    images = list(range(20))
+    cached = {f'key-{i}': {'status': True, 'latex': 'cached', 'confidence': 1.0,
+                           'request_id': None, 'message': None} for i in images[::3]}
+    results = collect(CachedOcrService(StubService(), DictCache(cached)), iter(images))
+    assert sorted(results) == images
+    for i in images:
+        expected = 'cached' if i % 3 == 0 else f'x_{{{i}}}'
+        assert results[i]['latex'] == expected
+
+
+class CountingService(BaseOcrService):
+    """记录每次调用识别接口时的图片尺寸"""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode_image(self, image_data):
+        return b'', 'png', 'image/png', {}
+
+    def recognize(self, image_data):
+        image = self.prepare(image_data)
+        self.calls.append(image.pixels.shape[:2])
+        return {'status': True, 'latex': 'x', 'confidence': 1.0, 'request_id': None, 'message': None}
+
+
+def formula_image(rows):
+    """白底图片，每个黑色横条代表一个公式"""
+    image = np.full((200, 600, 3), 255, np.uint8)
+    for top in rows:
+        image[top:top + 20, 200:400] = 0
+    return image
+
+
+def test_recognize_layout_single_region_calls_provider_once():
+    service = CountingService()
+    result = service.recognize_layout(formula_image([90]))
+    assert 'regions' not in result
+    assert service.calls == [(200, 600)]
+
+
+def test_recognize_layout_multiple_regions_calls_provider_per_region():
+    service = CountingService()
+    result = service.recognize_layout(formula_image([30, 150]))
+    assert len(result['regions']) == 2
+    assert len(service.calls) == 2
+    assert (200, 600) not in service.calls